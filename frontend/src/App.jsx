@@ -62,6 +62,25 @@ function App() {
   }
 
   // Chat Logic
+  // Applies a streamed chat event to the assistant reply being written
+  const updateReply = (event, data) => {
+    setMessages(prev => {
+      const last = prev[prev.length - 1]
+      const reply = last.streaming ? { ...last } : { role: 'assistant', content: '', streaming: true }
+      if (event === 'tool') {
+        reply.status = data.message
+      } else if (event === 'text') {
+        reply.content += data.delta
+        reply.status = null
+      } else if (event === 'done') {
+        reply.content = data.response
+        reply.status = null
+        reply.streaming = false
+      }
+      return last.streaming ? [...prev.slice(0, -1), reply] : [...prev, reply]
+    })
+  }
+
   const sendMessage = async () => {
     if (!input.trim() || loading) return
 
@@ -71,18 +90,33 @@ function App() {
     setLoading(true)
 
     try {
-      const response = await fetch(`${API_URL}/chat`, {
+      const response = await fetch(`${API_URL}/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
+        // Sends the session cookie, so the agent remembers this conversation
+        credentials: 'include',
         body: JSON.stringify({ message: userMessage })
       })
 
-      if (!response.ok) throw new Error('Failed to get response')
-
-      const data = await response.json()
-      setMessages(prev => [...prev, { role: 'assistant', content: data.response }])
+      if (!response.ok || !response.body) throw new Error('Failed to get response')
+
+      // Server-Sent Events: "event: <name>\ndata: <json>" frames, blank-line separated
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+      let buffer = ''
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += value
+        const frames = buffer.split('\n\n')
+        buffer = frames.pop()
+        for (const frame of frames) {
+          const event = frame.match(/^event: (.*)$/m)?.[1]
+          const data = frame.match(/^data: (.*)$/m)?.[1]
+          if (event && data) updateReply(event, JSON.parse(data))
+        }
+      }
     } catch (error) {
-      setMessages(prev => [...prev, {
+      setMessages(prev => [...prev.filter(m => !m.streaming), {
         role: 'assistant',
         content: "I'm sorry, I encountered an error. Please try again."
       }])
@@ -37,6 +37,7 @@ const ChatPage = ({ messages, loading, input, setInput, sendMessage, onBuy, getO
                             {msg.role === 'assistant' ? '🤖' : '👤'}
                         </div>
                         <div className="message-content">
+                            {msg.status && <p className="chat-status">{msg.status}</p>}
                             {msg.role === 'assistant' ? (
                                 <FormattedMessage
                                     content={msg.content}
@@ -50,7 +51,7 @@ const ChatPage = ({ messages, loading, input, setInput, sendMessage, onBuy, getO
                         </div>
                     </div>
                 ))}
-                {loading && (
+                {loading && !messages[messages.length - 1].streaming && (
                     <div className="message assistant">
                         <div className="message-avatar">🤖</div>
                         <div className="loading">
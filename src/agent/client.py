@@ -47,6 +47,18 @@ class UCPClient:
             {"id": "prod_023", "name": "Get Well Soon", "price": "44.99", "description": "Cheerful recovery flowers", "category": "arrangements"},
         ]
 
+    def get_products_by_ids(self, product_ids: List[str]) -> List[dict]:
+        """Get several products by ID in a single request.
+
+        IDs the server does not know are left out of the result.
+        """
+        response = self.client.get(
+            f"{self.base_url}/products/batch",
+            params={"ids": ",".join(product_ids)},
+        )
+        response.raise_for_status()
+        return response.json()["products"]
+
     def create_checkout(
         self,
         product_id: str,
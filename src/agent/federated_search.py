@@ -0,0 +1,422 @@
+"""Federated product search across every shop in the registry."""
+
+import asyncio
+import heapq
+import json
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.catalog import FacetAccumulator, SearchMode, matches_query, query_terms
+
+from .merge import FederatedMerge
+from .registry import ShopRegistry, shop_registry
+from .replica import FederationReplica, federation_replica
+from .resilience import FEDERATION_DEADLINE, CircuitBreaker, circuit_breakers, hedged
+from .search_cache import SearchCache, search_cache, search_key
+from .transport import ShopTransport, shop_transport
+
+# Number of results returned; each shop is only asked for this many
+TOP_K = 10
+# How shops match queries: "auto" retries with typo tolerance when the
+# exact query finds nothing
+SEARCH_MODE: SearchMode = "auto"
+
+
+class FederatedSearch:
+    """Searches every registered shop and merges the results.
+
+    Used by the federation agent's search tool and by the streaming search
+    endpoint, so both share one set of connections, caches, replicas and
+    circuit breakers.
+    """
+
+    def __init__(
+        self,
+        transport: ShopTransport = shop_transport,
+        cache: SearchCache = search_cache,
+        replica: FederationReplica = federation_replica,
+        breakers: Dict[str, CircuitBreaker] = circuit_breakers,
+        registry: ShopRegistry = shop_registry,
+        mode: SearchMode = SEARCH_MODE,
+    ):
+        # Pooled keep-alive connections to the shops, shared across searches
+        self.transport = transport
+        # Federated results shared across turns, since the model repeats searches
+        self.cache = cache
+        # Local copies of the shop catalogs, when replica mode is running
+        self.replica = replica
+        # Per-shop circuit breakers, so shops known to be down are skipped
+        self.breakers = breakers
+        # The shops to search, kept up to date from config and manifests
+        self.registry = registry
+        # How shops match queries; instances sharing a cache must agree on it
+        self.mode = mode
+
+    async def _search_shop(self, shop: dict, query: str = "", max_price: float = None, category: str = None, limit: int = TOP_K) -> dict:
+        """Search a single shop for its cheapest matching products.
+
+        Returns up to `limit` products, the shop's total number of matches
+        and facet counts over all of them. Slow searches are hedged with a
+        second request; errors are raised for the caller to record.
+        """
+        params = {"limit": limit, "sort": "price_asc", "facets": "true", "mode": self.mode}
+        if query:
+            params["q"] = query
+        if max_price:
+            params["max_price"] = max_price
+        if category:
+            params["category"] = category
+        
+        client = self.transport.client(shop["url"])
+        response = await hedged(
+            lambda: client.get(f"{shop['url']}/products/search", params=params)
+        )
+        if response.status_code != 404:
+            response.raise_for_status()
+            return _live_result(shop, response.json())
+        
+        # Shops without a search endpoint: scan the catalog export as it streams
+        # in, keeping only the cheapest `limit` matches (max-heap on price)
+        total = 0
+        cheapest = []
+        facets = FacetAccumulator()
+        async for p in self._iter_catalog(client, shop):
+            text = f"{p.get('name', '')} {p.get('description') or ''}"
+            if query and not matches_query(query, text):
+                continue
+            price = float(p.get("price", 999))
+            if max_price and price > max_price:
+                continue
+            if category and p.get("category") != category:
+                continue
+            total += 1
+            facets.add(price, p.get("category"))
+            entry = (-price, -total, p)
+            if len(cheapest) < limit:
+                heapq.heappush(cheapest, entry)
+            else:
+                heapq.heappushpop(cheapest, entry)
+        
+        products = [p for _, _, p in sorted(cheapest, reverse=True)]
+        for p in products:
+            p["shop_name"] = shop["name"]
+            p["shop_url"] = shop["url"]
+            # Ensure image exists
+            if not p.get("image"):
+                p["image"] = "https://images.unsplash.com/photo-1596627685652-320c82276cb0?w=400" # Fallback flower image
+        
+        return {"products": products, "total": total, "facets": facets.to_dict()}
+
+    async def _search_shop_batch(self, shop: dict, queries: List[dict], limit: int = TOP_K) -> List[dict]:
+        """Search a single shop for several queries in one request.
+
+        Returns one result per query, as _search_shop would. Shops without
+        a batch endpoint are searched once per query instead.
+        """
+        body = {
+            "queries": [
+                {"q": q["query"], "max_price": q["max_price"] or None, "category": q["category"] or None}
+                for q in queries
+            ],
+            "limit": limit,
+            "sort": "price_asc",
+            "facets": True,
+            "mode": self.mode,
+        }
+        client = self.transport.client(shop["url"])
+        response = await hedged(
+            lambda: client.post(f"{shop['url']}/products/search/batch", json=body)
+        )
+        if response.status_code in (404, 405):
+            return list(
+                await asyncio.gather(*(self._search_shop(shop, limit=limit, **q) for q in queries))
+            )
+        response.raise_for_status()
+        return [_live_result(shop, data) for data in response.json()["results"]]
+
+    def _prune(self, shops: List[dict], query: str, max_price: Optional[float], category: Optional[str]) -> Dict[str, str]:
+        """Shops whose summary rules out any match, with the reason.
+
+        Shops without a summary are never pruned. Summaries only know exact
+        terms and their prefixes, so query terms are only used to prune
+        exact searches: with typo tolerance any shop may match.
+        """
+        pruned = {}
+        terms = query_terms(query)
+        for shop in shops:
+            summary = self.registry.summary(shop["id"])
+            if summary is None:
+                continue
+            if not summary.may_match_filters(max_price, category):
+                pruned[shop["id"]] = "no_matching_products"
+            elif self.mode == "exact" and not summary.may_match_terms(terms):
+                pruned[shop["id"]] = "no_matching_terms"
+        return pruned
+
+    async def _iter_catalog(self, client: httpx.AsyncClient, shop: dict) -> AsyncIterator[dict]:
+        """Yield a shop's products from its NDJSON export as lines arrive.
+
+        Shops without an export endpoint are read from /products instead.
+        """
+        async with client.stream("GET", f"{shop['url']}/products/export") as response:
+            if response.status_code == 200:
+                async for line in response.aiter_lines():
+                    if line:
+                        yield json.loads(line)
+                return
+        
+        response = await client.get(f"{shop['url']}/products")
+        if response.status_code == 200:
+            for p in response.json():
+                yield p
+
+    async def search_all_shops(self, query: str = "", max_price: float = None, category: str = None, limit: int = TOP_K) -> dict:
+        """Search all shops and return the cheapest matches overall.
+
+        Also returns each shop's match count, facets merged across shops,
+        where each shop's results came from, and which shops were left out.
+        When every shop is replicated and fresh the search is answered
+        locally; otherwise results are cached (partial ones briefly), and
+        concurrent identical searches share one fan-out. The returned dict
+        is shared, so callers must not modify it.
+        """
+        shops = self.registry.shops
+        if self.replica.is_fresh(shops):
+            merge = FederatedMerge(shops, limit)
+            for shop in shops:
+                merge.add(shop, self.replica.search(shop, query, max_price, category, limit, self.mode))
+            return merge.to_dict()
+        return await self.cache.get(
+            search_key(query, max_price, category, limit),
+            lambda: self._fan_out(shops, query, max_price, category, limit),
+            complete=_complete,
+        )
+
+    async def search_many(self, queries: List[dict], limit: int = TOP_K) -> List[dict]:
+        """Run several searches across all shops with one request per shop.
+
+        queries are dicts of search_all_shops arguments (query, max_price,
+        category). Each answer is cached like the equivalent
+        search_all_shops, and only the queries not cached, stale or being
+        fetched are fanned out, together. Returns the answers in query
+        order; they are shared, so callers must not modify them.
+        """
+        shops = self.registry.shops
+        queries = [
+            {"query": q.get("query") or "", "max_price": q.get("max_price"), "category": q.get("category")}
+            for q in queries
+        ]
+        if self.replica.is_fresh(shops):
+            return [await self.search_all_shops(limit=limit, **q) for q in queries]
+        keys = [search_key(limit=limit, **q) for q in queries]
+        # Missing and stale answers are fetched together
+        outdated = {key: q for key, q in zip(keys, queries) if self.cache.needs_fetch(key)}
+        fetches = {}
+        if outdated:
+            # One fan-out for every outdated answer. Each is registered in
+            # the cache right away, so concurrent identical searches share
+            # it, and runs as a task, so a caller giving up does not cancel
+            # it. Stale answers are served below while they are refreshed.
+            batch = asyncio.ensure_future(self._fan_out_many(shops, list(outdated.values()), limit))
+            for i, key in enumerate(outdated):
+                task = self.cache.start_fetch(
+                    key, lambda i=i: _nth_answer(batch, i), complete=_complete
+                )
+                if task is not None:
+                    fetches[key] = task
+
+        async def answer(key: tuple, query: dict) -> dict:
+            if key in fetches:
+                return await asyncio.shield(fetches[key])
+            return await self.cache.get(
+                key, lambda: self._fan_out(shops, limit=limit, **query), complete=_complete
+            )
+
+        return list(await asyncio.gather(*(answer(key, q) for key, q in zip(keys, queries))))
+
+    async def _fan_out_many(self, shops: List[dict], queries: List[dict], limit: int) -> List[dict]:
+        """Answer several queries with at most one batch request per shop.
+
+        Replicas, pruning, circuit breakers and the deadline apply as in
+        stream(), per shop and query.
+        """
+        merges = [FederatedMerge(shops, limit) for _ in queries]
+        pruned = [self._prune(shops, **q) for q in queries]
+        tasks: Dict[asyncio.Task, Tuple[dict, List[int]]] = {}
+        # Tasks whose outcome the shop's breaker has recorded
+        settled = set()
+        try:
+            for shop in shops:
+                wanted = []
+                for i, query in enumerate(queries):
+                    result = self.replica.search(shop, limit=limit, mode=self.mode, **query)
+                    if result is not None:
+                        merges[i].add(shop, result)
+                    elif shop["id"] in pruned[i]:
+                        merges[i].prune(shop, pruned[i][shop["id"]])
+                    else:
+                        wanted.append(i)
+                if not wanted:
+                    continue
+                if not self.breakers[shop["id"]].allow():
+                    for i in wanted:
+                        merges[i].exclude(shop, "circuit_open")
+                    continue
+                task = asyncio.create_task(
+                    self._search_shop_batch(shop, [queries[i] for i in wanted], limit)
+                )
+                tasks[task] = (shop, wanted)
+
+            if tasks:
+                await asyncio.wait(tasks, timeout=FEDERATION_DEADLINE)
+            for task, (shop, wanted) in tasks.items():
+                settled.add(task)
+                breaker = self.breakers[shop["id"]]
+                if not task.done():
+                    reason = "timeout"
+                elif task.exception() is not None:
+                    print(f"Error searching {shop['name']}: {task.exception()!r}")
+                    reason = "error"
+                else:
+                    breaker.record_success()
+                    for i, result in zip(wanted, task.result()):
+                        merges[i].add(shop, result)
+                    continue
+                breaker.record_failure()
+                for i in wanted:
+                    merges[i].exclude(shop, reason)
+        finally:
+            for task, (shop, _) in tasks.items():
+                task.cancel()
+                if task not in settled:
+                    # Cancelled before an outcome (e.g. the caller timed out)
+                    self.breakers[shop["id"]].release()
+        return [merge.to_dict() for merge in merges]
+
+    async def _fan_out(self, shops: List[dict], query: str, max_price: Optional[float], category: Optional[str], limit: int) -> dict:
+        # The merged answer is the last event
+        async for _, data in self.stream(query, max_price, category, limit, shops):
+            pass
+        return data
+
+    async def stream(
+        self,
+        query: str = "",
+        max_price: Optional[float] = None,
+        category: Optional[str] = None,
+        limit: int = TOP_K,
+        shops: Optional[List[dict]] = None,
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """Query every shop concurrently and yield events as they answer.
+
+        Yields ("shop", result) as each shop answers, ("pruned", ...) for
+        each shop whose summary shows it cannot match, ("excluded", ...)
+        for each shop left out, and finally ("results", ...) with the same
+        merged answer as search_all_shops. Fresh replicas answer first.
+        Pruned shops are not queried, so fan-out cost follows the shops
+        that can match. Shops whose circuit breaker is open are skipped,
+        and shops that have not answered within the fan-out deadline are
+        left out, so one slow shop only costs partial results.
+        """
+        shops = self.registry.shops if shops is None else shops
+        merge = FederatedMerge(shops, limit)
+        tasks = {}
+        pending = []
+        pruned = self._prune(shops, query, max_price, category)
+        try:
+            for shop in shops:
+                result = self.replica.search(shop, query, max_price, category, limit, self.mode)
+                if result is not None:
+                    merge.add(shop, result)
+                    yield "shop", _shop_event(shop, result)
+                elif shop["id"] in pruned:
+                    merge.prune(shop, pruned[shop["id"]])
+                    yield "pruned", _excluded_event(shop, pruned[shop["id"]])
+                elif not self.breakers[shop["id"]].allow():
+                    merge.exclude(shop, "circuit_open")
+                    yield "excluded", _excluded_event(shop, "circuit_open")
+                else:
+                    tasks[shop["id"]] = asyncio.create_task(
+                        self._search_shop(shop, query, max_price, category, limit)
+                    )
+                    pending.append(shop)
+
+            async def answer(shop):
+                # Pairs each response with its shop for as_completed
+                try:
+                    return shop, await tasks[shop["id"]], None
+                except Exception as e:
+                    return shop, None, e
+
+            try:
+                for next_answer in asyncio.as_completed(
+                    [answer(shop) for shop in pending], timeout=FEDERATION_DEADLINE
+                ):
+                    shop, result, error = await next_answer
+                    pending.remove(shop)
+                    breaker = self.breakers[shop["id"]]
+                    if error is not None:
+                        print(f"Error searching {shop['name']}: {error!r}")
+                        breaker.record_failure()
+                        merge.exclude(shop, "error")
+                        yield "excluded", _excluded_event(shop, "error")
+                    else:
+                        breaker.record_success()
+                        merge.add(shop, result)
+                        yield "shop", _shop_event(shop, result)
+            except asyncio.TimeoutError:
+                pass
+            while pending:
+                shop = pending.pop(0)
+                tasks[shop["id"]].cancel()
+                self.breakers[shop["id"]].record_failure()
+                merge.exclude(shop, "timeout")
+                yield "excluded", _excluded_event(shop, "timeout")
+            yield "results", merge.to_dict()
+        finally:
+            # The consumer went away (e.g. a client disconnected mid-stream)
+            for shop in pending:
+                tasks[shop["id"]].cancel()
+                self.breakers[shop["id"]].release()
+
+
+def _complete(search: dict) -> bool:
+    """Whether a federated answer covers every shop; partial ones are cached briefly."""
+    return not search["shops_excluded"]
+
+
+async def _nth_answer(batch: Awaitable[List[dict]], i: int) -> dict:
+    return (await batch)[i]
+
+
+def _live_result(shop: dict, data: dict) -> dict:
+    """A shop's /products/search response as a per-shop search result."""
+    products = data.get("products", data)
+    for p in products:
+        p["shop_name"] = shop["name"]
+        p["shop_url"] = shop["url"]
+    return {
+        "products": products,
+        "total": data.get("total", len(products)),
+        "facets": data.get("facets"),
+    }
+
+
+def _shop_event(shop: dict, result: dict) -> dict:
+    return {
+        "shop": shop["name"],
+        "shop_id": shop["id"],
+        "products": result["products"],
+        "total": result["total"],
+        "facets": result["facets"],
+        "freshness": result.get("freshness", {"source": "live"}),
+    }
+
+
+def _excluded_event(shop: dict, reason: str) -> dict:
+    return {"shop": shop["name"], "shop_id": shop["id"], "reason": reason}
+
+
+# Shared by every agent in the process
+federated_search = FederatedSearch()
@@ -1,42 +1,47 @@
 """Federation Agent - queries multiple UCP shops to find the best products."""
 
-import httpx
 import json
 import os
+import re
 import asyncio
-from typing import Optional, List
+from contextlib import aclosing
+from typing import AsyncIterator, Optional, List, Tuple
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from src.catalog import MAX_BATCH_QUERIES
+
+from .federated_search import TOP_K, FederatedSearch, federated_search
+from .history import HistoryManager
+from .llm_limiter import LLMLimiter, llm_limiter
+from .registry import shop_registry
+
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MODEL_ID = "models/gemini-2.5-flash"
 
-# All UCP shops in the federation
-SHOPS = [
-    {"id": "ucp_flower_shop", "name": "UCP Flower Shop", "url": "http://localhost:8183"},
-    {"id": "garden_paradise", "name": "Garden Paradise", "url": "http://localhost:8184"},
-    {"id": "luxury_blooms", "name": "Luxury Blooms", "url": "http://localhost:8185"},
-    {"id": "green_thumb", "name": "Green Thumb Plants", "url": "http://localhost:8186"},
-]
+# Shops listed by name in the system prompt; the rest are only counted
+PROMPT_MAX_SHOPS = 25
 
 SYSTEM_PROMPT = """You are a smart shopping assistant that can search across multiple flower shops to find the best deals.
 
 Available shops:
-1. UCP Flower Shop - Main shop with varied selection
-2. Garden Paradise - Budget-friendly flowers
-3. Luxury Blooms - Premium flowers for special occasions
-4. Green Thumb Plants - Indoor plants and succulents
+{shop_list}
 
 You can:
 - Search products across ALL shops at once
+- Search for several different products in one call with search_all_shops_batch (e.g. roses, tulips and lilies)
 - Filter by price (e.g., "under $15")
 - Filter by category (flowers, plants, arrangements)
 - Compare prices across shops
 - Help users find the best deals
 
+Search results are grouped by product: each group has its price range and
+every shop's offer (id, price, shop_name), cheapest first. Use an offer's id
+and shop_name for its product card.
+
 When you find matching products, you MUST display them to the user.
 For each product you recommend, you MUST include a special JSON block at the end of your response so the UI can render a clickable card.
 Format:
@@ -108,90 +113,131 @@ SEARCH_ALL_SHOPS = types.FunctionDeclaration(
             "query": types.Schema(type=types.Type.STRING, description="Product name or keyword to search"),
             "max_price": types.Schema(type=types.Type.NUMBER, description="Maximum price filter"),
             "category": types.Schema(type=types.Type.STRING, description="Category: flowers, plants, or arrangements"),
+            "summary_only": types.Schema(type=types.Type.BOOLEAN, description="Return only match counts per shop, category counts, price histogram and price range, without product listings. Use for comparisons and 'how many' questions."),
+            "group_by_product": types.Schema(type=types.Type.BOOLEAN, description="Defaults to true: one entry per product with its min/max price and every shop's offer, cheapest first. Set to false for a flat list of individual listings."),
+        },
+    ),
+)
+
+SEARCH_ALL_SHOPS_BATCH = types.FunctionDeclaration(
+    name="search_all_shops_batch",
+    description="Run several product searches across all UCP shops in one call. Use this instead of repeated search_all_shops calls when looking for several different products.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "queries": types.Schema(
+                type=types.Type.ARRAY,
+                description=f"Searches to run, at most {MAX_BATCH_QUERIES}",
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "query": types.Schema(type=types.Type.STRING, description="Product name or keyword to search"),
+                        "max_price": types.Schema(type=types.Type.NUMBER, description="Maximum price filter"),
+                        "category": types.Schema(type=types.Type.STRING, description="Category: flowers, plants, or arrangements"),
+                    },
+                ),
+            ),
+            "summary_only": SEARCH_ALL_SHOPS.parameters.properties["summary_only"],
+            "group_by_product": SEARCH_ALL_SHOPS.parameters.properties["group_by_product"],
         },
+        required=["queries"],
     ),
 )
 
-FEDERATION_TOOLS = types.Tool(function_declarations=[SEARCH_ALL_SHOPS])
+FEDERATION_TOOLS = types.Tool(function_declarations=[SEARCH_ALL_SHOPS, SEARCH_ALL_SHOPS_BATCH])
+
+
+# The JSON block of product cards the system prompt asks for
+CARDS_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```", re.IGNORECASE)
+
+
+def extract_cards(text: str) -> List[dict]:
+    """The product cards (or actions) in an answer's JSON block, if any."""
+    match = CARDS_RE.search(text)
+    if not match:
+        return []
+    try:
+        cards = json.loads(match.group(1))
+    except ValueError:
+        return []
+    return cards if isinstance(cards, list) else []
+
+
+def _merge_text(parts: List[types.Part]) -> List[types.Part]:
+    """Join consecutive plain text parts of a streamed response."""
+    merged = []
+    for part in parts:
+        plain = part.text is not None and not (part.thought or part.thought_signature or part.function_call)
+        if plain and merged and merged[-1].text is not None and not merged[-1].thought_signature:
+            merged[-1] = types.Part(text=merged[-1].text + part.text)
+        else:
+            merged.append(types.Part(text=part.text) if plain else part)
+    return merged
+
+
+def build_system_prompt(shops: List[dict]) -> str:
+    """The system prompt, listing the shops currently in the federation."""
+    lines = [
+        f"{i}. {shop['name']}" + (f" - {shop['description']}" if shop.get("description") else "")
+        for i, shop in enumerate(shops[:PROMPT_MAX_SHOPS], 1)
+    ]
+    if len(shops) > PROMPT_MAX_SHOPS:
+        lines.append(f"...and {len(shops) - PROMPT_MAX_SHOPS} more shops")
+    return SYSTEM_PROMPT.replace("{shop_list}", "\n".join(lines))
 
 
 class FederationAgent:
     """Agent that queries multiple UCP shops."""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        search: FederatedSearch = federated_search,
+        client: Optional[genai.Client] = None,
+        limiter: LLMLimiter = llm_limiter,
+    ):
         self.api_key = api_key or GEMINI_API_KEY
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is required")
         
-        self.client = genai.Client(api_key=self.api_key)
-        self.http_client = httpx.Client(timeout=10.0)
-        self.chat_history: list[types.Content] = []
-
-    async def _search_shop(self, shop: dict, query: str = "", max_price: float = None, category: str = None) -> List[dict]:
-        """Search a single shop for products."""
-        try:
-            params = {}
-            if query:
-                params["q"] = query
-            if max_price:
-                params["max_price"] = max_price
-            if category:
-                params["category"] = category
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Try search endpoint first
-                try:
-                    response = await client.get(f"{shop['url']}/products/search", params=params)
-                    if response.status_code == 200:
-                        data = response.json()
-                        products = data.get("products", data)
-                        for p in products:
-                            p["shop_name"] = shop["name"]
-                            p["shop_url"] = shop["url"]
-                        return products
-                except:
-                    pass
-                
-                # Fall back to getting all products
-                response = await client.get(f"{shop['url']}/products")
-                if response.status_code != 200:
-                    return []
-                
-                products = response.json()
-            
-            # Filter locally
-            if query:
-                products = [p for p in products if query.lower() in p.get("name", "").lower() or query.lower() in p.get("description", "").lower()]
-            if max_price:
-                products = [p for p in products if float(p.get("price", 999)) <= max_price]
-            if category:
-                products = [p for p in products if p.get("category") == category]
-            
-            for p in products:
-                p["shop_name"] = shop["name"]
-                p["shop_url"] = shop["url"]
-                # Ensure image exists
-                if not p.get("image"):
-                    p["image"] = "https://images.unsplash.com/photo-1596627685652-320c82276cb0?w=400" # Fallback flower image
-            
-            return products
-        except Exception as e:
-            print(f"Error searching {shop['name']}: {e}")
-            return []
-
-    async def search_all_shops(self, query: str = "", max_price: float = None, category: str = None) -> List[dict]:
-        """Search all shops and combine results."""
-        import asyncio
-        tasks = [self._search_shop(shop, query, max_price, category) for shop in SHOPS]
-        results_list = await asyncio.gather(*tasks)
-        
-        all_results = []
-        for r in results_list:
-            all_results.extend(r)
-        
-        # Sort by price
-        all_results.sort(key=lambda x: float(x.get("price", 999)))
-        return all_results
+        # Agents serving separate chat sessions can share one client
+        self.client = client or genai.Client(api_key=self.api_key)
+        # Bounds model calls across every agent in the process
+        self.limiter = limiter
+        # Shop fan-out, shared with the streaming search endpoint
+        self.search = search
+        self.registry = search.registry
+        # Sent with every request, compacted to a token budget
+        self.history = HistoryManager()
+
+    async def search_all_shops(self, query: str = "", max_price: float = None, category: str = None, limit: int = TOP_K) -> dict:
+        """Search all shops and return the cheapest matches overall.
+
+        See FederatedSearch.search_all_shops; the returned dict is shared,
+        so callers must not modify it.
+        """
+        return await self.search.search_all_shops(query, max_price, category, limit)
+
+    async def search_many(self, queries: List[dict], limit: int = TOP_K) -> List[dict]:
+        """Run several searches across all shops with one request per shop.
+
+        See FederatedSearch.search_many; the returned dicts are shared, so
+        callers must not modify them.
+        """
+        return await self.search.search_many(queries, limit)
+
+    @staticmethod
+    def _tool_result(search: dict, args: dict) -> dict:
+        """A search answer trimmed to what the tool call asked for."""
+        if not search["total_results"]:
+            return {"message": "No products found matching your criteria", "results": []}
+        if args.get("summary_only"):
+            omit = {"results", "groups"}
+        elif args.get("group_by_product", True):
+            omit = {"results"}
+        else:
+            omit = {"groups"}
+        return {key: value for key, value in search.items() if key not in omit}
 
     async def _execute_tool(self, function_call: types.FunctionCall) -> str:
         """Execute a tool function."""
@@ -199,84 +245,126 @@ class FederationAgent:
         args = dict(function_call.args) if function_call.args else {}
         
         if name == "search_all_shops":
-            results = await self.search_all_shops(
+            search = await self.search_all_shops(
                 query=args.get("query", ""),
                 max_price=args.get("max_price"),
                 category=args.get("category"),
             )
-            
-            if not results:
-                return json.dumps({"message": "No products found matching your criteria", "results": []})
-            
-            return json.dumps({
-                "total_results": len(results),
-                "results": results[:10]  # Limit to top 10
-            }, indent=2)
+            # Compact separators: indentation only costs the model tokens
+            return json.dumps(self._tool_result(search, args), separators=(",", ":"))
+
+        if name == "search_all_shops_batch":
+            queries = [dict(query) for query in args.get("queries") or []][:MAX_BATCH_QUERIES]
+            searches = await self.search_many(queries)
+            return json.dumps(
+                {
+                    "searches": [
+                        {"query": query, **self._tool_result(search, args)}
+                        for query, search in zip(queries, searches)
+                    ]
+                },
+                separators=(",", ":"),
+            )
         
         return json.dumps({"error": f"Unknown function: {name}"})
 
-    async def chat(self, user_message: str) -> str:
-        """Send a message and get a response."""
-        self.chat_history.append(
+    def _tool_progress(self, function_call: types.FunctionCall) -> str:
+        """What the agent is doing while a tool runs, for the chat UI."""
+        args = dict(function_call.args) if function_call.args else {}
+        shops = len(self.registry.shops)
+        if function_call.name == "search_all_shops":
+            query = args.get("query") or args.get("category") or "products"
+            return f"Searching {shops} shops for {query}…"
+        if function_call.name == "search_all_shops_batch":
+            return f"Searching {shops} shops for {len(args.get('queries') or [])} products…"
+        return f"Running {function_call.name}…"
+
+    async def chat_stream(self, user_message: str) -> AsyncIterator[Tuple[str, dict]]:
+        """Send a message and yield the response as it is generated.
+
+        Yields ("tool", ...) with a progress message for each tool call,
+        ("text", {"delta": ...}) as text arrives, ("cards", {"cards": ...})
+        with the answer's product cards if it has any, and finally
+        ("done", {"response": ...}) with all the text of the answer.
+        """
+        self.history.append(
             types.Content(role="user", parts=[types.Part(text=user_message)])
         )
 
-        # Run blocking generate_content in thread pool
-        response = await asyncio.to_thread(
-            self.client.models.generate_content,
-            model=MODEL_ID,
-            contents=self.chat_history,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-                tools=[FEDERATION_TOOLS],
-            ),
-        )
-
-        # Handle function calls
-        while response.candidates[0].content.parts:
-            part = response.candidates[0].content.parts[0]
-            
-            if part.function_call:
-                function_call = part.function_call
-                # Execute tool asynchronously
-                result = await self._execute_tool(function_call)
-                
-                self.chat_history.append(response.candidates[0].content)
-                self.chat_history.append(
-                    types.Content(
-                        role="user",
-                        parts=[types.Part(function_response=types.FunctionResponse(
-                            name=function_call.name,
-                            response={"result": result},
-                        ))],
-                    )
-                )
-                
-                # Generate next response
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
+        streamed = []
+        while True:
+            parts = []
+            # The slot is held while the answer streams in; cancelling the
+            # turn (e.g. on timeout) closes the upstream request
+            async with self.limiter.slot():
+                stream = await self.client.aio.models.generate_content_stream(
                     model=MODEL_ID,
-                    contents=self.chat_history,
+                    contents=self.history.for_request(),
                     config=types.GenerateContentConfig(
-                        system_instruction=SYSTEM_PROMPT,
+                        system_instruction=build_system_prompt(self.registry.shops),
                         tools=[FEDERATION_TOOLS],
                     ),
                 )
-            else:
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        if not chunk.candidates or not chunk.candidates[0].content:
+                            continue
+                        for part in chunk.candidates[0].content.parts or []:
+                            if part.text and not part.thought:
+                                streamed.append(part.text)
+                                yield "text", {"delta": part.text}
+                            parts.append(part)
+
+            # Handle function calls: every call of the turn runs concurrently
+            # and all responses go back in one message
+            function_calls = [part.function_call for part in parts if part.function_call]
+            if not function_calls:
                 break
-        
-        assistant_text = response.text if response.text else "Sorry, I couldn't process that."
-        self.chat_history.append(
-            types.Content(role="model", parts=[types.Part(text=assistant_text)])
+            for function_call in function_calls:
+                yield "tool", {"name": function_call.name, "message": self._tool_progress(function_call)}
+            results = await asyncio.gather(*(self._execute_tool(call) for call in function_calls))
+
+            self.history.append(types.Content(role="model", parts=_merge_text(parts)))
+            self.history.append(
+                types.Content(
+                    role="user",
+                    parts=[
+                        types.Part(function_response=types.FunctionResponse(
+                            id=function_call.id,
+                            name=function_call.name,
+                            response={"result": result},
+                        ))
+                        for function_call, result in zip(function_calls, results)
+                    ],
+                )
+            )
+
+        final_text = "".join(part.text for part in parts if part.text and not part.thought)
+        if not final_text:
+            final_text = "Sorry, I couldn't process that."
+            streamed.append(final_text)
+            yield "text", {"delta": final_text}
+        self.history.append(
+            types.Content(role="model", parts=[types.Part(text=final_text)])
         )
-        
-        return assistant_text
+
+        response = "".join(streamed)
+        cards = extract_cards(response)
+        if cards:
+            yield "cards", {"cards": cards}
+        yield "done", {"response": response}
+
+    async def chat(self, user_message: str) -> str:
+        """Send a message and get a response."""
+        async for event, data in self.chat_stream(user_message):
+            if event == "done":
+                return data["response"]
 
     def reset(self):
-        self.chat_history = []
+        self.history.clear()
 
-    def close(self):
-        self.http_client.close()
+    async def aclose(self):
+        await self.search.transport.aclose()
 
 
 def main():
@@ -285,7 +373,7 @@ def main():
     print("🌐 UCP Federation Agent - Search Across All Shops")
     print("=" * 60)
     print("\nConnected shops:")
-    for shop in SHOPS:
+    for shop in shop_registry.shops:
         print(f"  • {shop['name']} ({shop['url']})")
     print("\nTry: 'Find roses under $15' or 'Show me cheap flowers'")
     print("Type 'quit' to exit\n")
@@ -297,6 +385,9 @@ def main():
         print(f"Error: {e}")
         return
 
+    # One event loop for the whole session, so pooled connections are reused
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(agent.registry.refresh())
     try:
         while True:
             user_input = input("\nYou: ").strip()
@@ -313,12 +404,13 @@ def main():
             
             try:
                 # Chat is now async
-                response = asyncio.run(agent.chat(user_input))
+                response = loop.run_until_complete(agent.chat(user_input))
                 print(f"\n🤖 Agent: {response}")
             except Exception as e:
                 print(f"\n❌ Error: {e}")
     finally:
-        agent.close()
+        loop.run_until_complete(agent.aclose())
+        loop.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""Chat history kept within a token budget for every model request."""
+
+import json
+import os
+from typing import Any, List, Optional
+
+from google.genai import types
+
+# Estimated tokens of history sent with each request
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Most recent turns (a user message and everything after it) kept verbatim
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+# Rough size of a token in English text and JSON; estimates need no tokenizer
+CHARS_PER_TOKEN = 4
+# Per-part overhead of the request encoding, in tokens
+PART_OVERHEAD_TOKENS = 4
+
+# Fields kept for each listed item when a tool response is compacted, so
+# the model can still refer to products it has already shown. Product
+# groups keep their price range and cheapest offer.
+SUMMARY_ITEM_FIELDS = ("id", "name", "price", "shop_name", "status")
+SUMMARY_GROUP_FIELDS = ("name", "min_price", "max_price", "shop_count")
+SUMMARY_OFFER_FIELDS = ("id", "price", "shop_name")
+SUMMARY_MAX_ITEMS = 10
+SUMMARY_MAX_STRING = 80
+
+
+def estimate_tokens(content: types.Content) -> int:
+    """Estimate the tokens a message costs in a request, from its size."""
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        elif part.function_call:
+            chars += len(part.function_call.name or "") + len(
+                json.dumps(part.function_call.args or {}, default=str)
+            )
+        elif part.function_response:
+            chars += len(part.function_response.name or "") + len(
+                json.dumps(part.function_response.response or {}, default=str)
+            )
+    return chars // CHARS_PER_TOKEN + PART_OVERHEAD_TOKENS * len(content.parts or [])
+
+
+def _is_user_message(content: types.Content) -> bool:
+    """Whether a message starts a turn: user text, not a function response."""
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def _summarize(value: Any) -> Any:
+    """Shrink a decoded tool result to its scalars and the items it listed."""
+    if isinstance(value, str):
+        if len(value) <= SUMMARY_MAX_STRING:
+            return value
+        return value[:SUMMARY_MAX_STRING] + "..."
+    if isinstance(value, list):
+        items = [
+            _summarize_item(item) for item in value[:SUMMARY_MAX_ITEMS] if isinstance(item, dict)
+        ]
+        if any(items):
+            return items
+        return f"{len(value)} items"
+    if isinstance(value, dict):
+        return {key: _summarize(item) for key, item in value.items()}
+    return value
+
+
+def _summarize_item(item: dict) -> dict:
+    """A listed item reduced to the fields that identify it.
+
+    Product groups keep their cheapest offer; items holding lists of their
+    own (e.g. each search of a batch) are summarized recursively; other
+    items, such as facet buckets, are dropped.
+    """
+    if "offers" in item:
+        summary = {key: item[key] for key in SUMMARY_GROUP_FIELDS if key in item}
+        summary["offers"] = [
+            {key: offer[key] for key in SUMMARY_OFFER_FIELDS if key in offer}
+            for offer in item["offers"][:1]
+        ]
+        return summary
+    summary = {key: item[key] for key in SUMMARY_ITEM_FIELDS if key in item}
+    if summary:
+        return summary
+    if any(isinstance(field, (dict, list)) for field in item.values()):
+        return _summarize(item)
+    return {}
+
+
+def compact_result(result: Any) -> str:
+    """A tool result (JSON string) reduced to a short summary."""
+    try:
+        value = json.loads(result) if isinstance(result, str) else result
+    except ValueError:
+        return _summarize(str(result))
+    if not isinstance(value, (dict, list)):
+        return _summarize(str(result))
+    return json.dumps(_summarize(value), separators=(",", ":"), default=str)
+
+
+class HistoryManager:
+    """A conversation's messages, compacted to fit a token budget.
+
+    Every message is kept until the estimated size of the history passes
+    the budget. Then, oldest first and outside the last keep_turns turns,
+    tool responses are replaced by a short summary, and if that is not
+    enough whole turns are dropped, so function calls stay paired with
+    their responses. Recent turns are always sent as they are, even over
+    budget. Token counts are local estimates (see estimate_tokens).
+    """
+
+    def __init__(self, budget: int = HISTORY_TOKEN_BUDGET, keep_turns: int = HISTORY_KEEP_TURNS):
+        self.budget = budget
+        self.keep_turns = max(keep_turns, 1)
+        self.contents: List[types.Content] = []
+        self._tokens: List[int] = []
+        # Tokens of everything ever appended, i.e. what the full history would cost
+        self.full_tokens = 0
+        self.requests = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+        self.responses_compacted = 0
+        self.turns_dropped = 0
+
+    @property
+    def tokens(self) -> int:
+        return sum(self._tokens)
+
+    def append(self, content: types.Content) -> None:
+        tokens = estimate_tokens(content)
+        self.contents.append(content)
+        self._tokens.append(tokens)
+        self.full_tokens += tokens
+
+    def clear(self) -> None:
+        self.contents = []
+        self._tokens = []
+        self.full_tokens = 0
+
+    def for_request(self) -> List[types.Content]:
+        """The history to send with the next request, compacted if needed."""
+        if self.tokens > self.budget:
+            self._compact()
+        tokens = self.tokens
+        self.requests += 1
+        self.tokens_sent += tokens
+        self.tokens_saved += self.full_tokens - tokens
+        return self.contents
+
+    def _compact(self) -> None:
+        turn_starts = [i for i, content in enumerate(self.contents) if _is_user_message(content)]
+        if len(turn_starts) <= self.keep_turns:
+            return
+        recent = turn_starts[-self.keep_turns]
+        total = self.tokens
+        for i in range(recent):
+            if total <= self.budget:
+                return
+            compacted = self._compact_responses(self.contents[i])
+            if compacted is not None:
+                self.contents[i] = compacted
+                tokens = estimate_tokens(compacted)
+                total += tokens - self._tokens[i]
+                self._tokens[i] = tokens
+
+        # Still over budget: drop the oldest turns
+        turn = 0
+        while total > self.budget and turn < len(turn_starts) - self.keep_turns:
+            turn += 1
+            total -= sum(self._tokens[turn_starts[turn - 1]:turn_starts[turn]])
+        if turn:
+            del self.contents[:turn_starts[turn]]
+            del self._tokens[:turn_starts[turn]]
+            self.turns_dropped += turn
+
+    def _compact_responses(self, content: types.Content) -> Optional[types.Content]:
+        """content with its tool responses summarized, or None if it has none."""
+        if not any(
+            part.function_response and not (part.function_response.response or {}).get("compacted")
+            for part in content.parts or []
+        ):
+            return None
+        parts = []
+        for part in content.parts:
+            response = part.function_response
+            if response is None or (response.response or {}).get("compacted"):
+                parts.append(part)
+                continue
+            summary = compact_result((response.response or {}).get("result"))
+            parts.append(
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id=response.id,
+                        name=response.name,
+                        response={"result": summary, "compacted": True},
+                    )
+                )
+            )
+            self.responses_compacted += 1
+        return types.Content(role=content.role, parts=parts)
+
+    def stats(self) -> dict:
+        """Size of the history, and how much compaction has kept out of requests.
+
+        tokens_saved counts, over all requests, the estimated tokens the
+        full history would have added.
+        """
+        return {
+            "messages": len(self.contents),
+            "tokens": self.tokens,
+            "full_tokens": self.full_tokens,
+            "budget": self.budget,
+            "requests": self.requests,
+            "tokens_sent": self.tokens_sent,
+            "tokens_saved": self.tokens_saved,
+            "responses_compacted": self.responses_compacted,
+            "turns_dropped": self.turns_dropped,
+        }
@@ -0,0 +1,71 @@
+"""Process-wide limit on in-flight model calls."""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+# Model calls in flight at once, and calls allowed to wait for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+
+
+class LLMOverloaded(RuntimeError):
+    """Raised when every slot is busy and the wait queue is full."""
+
+
+class LLMLimiter:
+    """Semaphore with a bounded FIFO queue in front of the model API.
+
+    At most max_concurrency calls run at once; up to max_queue more wait
+    for a slot in arrival order, and calls beyond that fail fast with
+    LLMOverloaded instead of piling up. A caller cancelled while waiting
+    (e.g. by a chat timeout) leaves the queue without taking a slot.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of one model call."""
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloaded("Too many model calls in flight")
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_seconds += time.monotonic() - started
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.wait_seconds / self.calls if self.calls else None,
+        }
+
+
+# Shared by every agent in the process
+llm_limiter = LLMLimiter()
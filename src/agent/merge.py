@@ -0,0 +1,103 @@
+"""Incremental top-k merge of per-shop search results."""
+
+import heapq
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+from src.catalog import FacetAccumulator, ProductGroups
+
+
+def _price(product: dict) -> float:
+    return float(product.get("price", 999))
+
+
+class TopKMerger:
+    """The k cheapest products across sources whose results are sorted by price.
+
+    Sources are added in any order as they answer. Only the current top k
+    are kept, in a max-heap rooted at the worst kept product, so the union
+    of all sources is never built. A source's products are consumed in
+    order and the rest of the source is skipped at the first product that
+    cannot make the top k. Ties are broken by source order, so the result
+    does not depend on which source answered first.
+    """
+
+    def __init__(self, k: int, sources: Iterable[Hashable]):
+        self.k = k
+        self.ranks = {source: rank for rank, source in enumerate(sources)}
+        # (negated (price, source rank, position), product): the root is the worst kept
+        self._heap: List[Tuple[Tuple[float, int, int], dict]] = []
+
+    def add(self, source: Hashable, products: Iterable[dict]) -> None:
+        """Merge all of a source's results, cheapest first."""
+        rank = self.ranks[source]
+        for position, product in enumerate(products):
+            key = (_price(product), rank, position)
+            negated = (-key[0], -key[1], -key[2])
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, (negated, product))
+            elif negated > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (negated, product))
+            else:
+                break
+
+    def results(self) -> List[dict]:
+        """The top k so far, cheapest first."""
+        return [product for _, product in sorted(self._heap, reverse=True)]
+
+
+class FederatedMerge:
+    """Merges shop search results as they arrive.
+
+    Keeps the top k products, the k cheapest product groups, per-shop
+    totals and freshness, merged facets, the shops left out and the shops
+    skipped as unable to match, and renders the search_all_shops answer.
+    Groups are built from every product the shops return, so an item's
+    offers are compared even when only its cheapest listing makes the top k.
+    """
+
+    def __init__(self, shops: List[dict], k: int):
+        self.shops = shops
+        self.top_k = TopKMerger(k, [shop["id"] for shop in shops])
+        self.totals: Dict[str, int] = {}
+        self.freshness: Dict[str, dict] = {}
+        self.excluded: Dict[str, str] = {}
+        self.pruned: Dict[str, str] = {}
+        self.facets = FacetAccumulator()
+        self.groups = ProductGroups()
+
+    def add(self, shop: dict, result: dict) -> None:
+        self.top_k.add(shop["id"], result["products"])
+        for product in result["products"]:
+            self.groups.add(product)
+        self.totals[shop["id"]] = result["total"]
+        self.freshness[shop["id"]] = result.get("freshness", {"source": "live"})
+        self.facets.merge(result["facets"])
+
+    def exclude(self, shop: dict, reason: str) -> None:
+        self.excluded[shop["id"]] = reason
+
+    def prune(self, shop: dict, reason: str) -> None:
+        self.pruned[shop["id"]] = reason
+
+    def to_dict(self) -> dict:
+        names = {shop["id"]: shop["name"] for shop in self.shops}
+        included = [shop["id"] for shop in self.shops if shop["id"] in self.totals]
+        return {
+            "total_results": sum(self.totals.values()),
+            "shop_totals": {names[shop_id]: self.totals[shop_id] for shop_id in included},
+            "shops_included": [names[shop_id] for shop_id in included],
+            "shops_excluded": {
+                names[shop["id"]]: self.excluded[shop["id"]]
+                for shop in self.shops
+                if shop["id"] in self.excluded
+            },
+            "shops_pruned": {
+                names[shop["id"]]: self.pruned[shop["id"]]
+                for shop in self.shops
+                if shop["id"] in self.pruned
+            },
+            "freshness": {names[shop_id]: self.freshness[shop_id] for shop_id in included},
+            "facets": self.facets.to_dict(),
+            "results": self.top_k.results(),
+            "groups": self.groups.to_list(self.top_k.k),
+        }
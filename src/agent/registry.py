@@ -0,0 +1,281 @@
+"""Registry of the shops in the federation, with cached manifests and summaries."""
+
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.catalog import CatalogSummary
+
+from .transport import ShopTransport, shop_transport
+
+# A JSON file, or a directory of JSON files, listing shops. Each entry needs
+# a "url" and may set "id", "name" and "description". Edits are picked up
+# on the next refresh.
+SHOPS_CONFIG = os.getenv("SHOPS_CONFIG")
+REGISTRY_REFRESH_INTERVAL = float(os.getenv("REGISTRY_REFRESH_INTERVAL", "30"))
+# Manifest lifetime when a shop sends no Cache-Control max-age, and the
+# retry delay after a failed fetch
+MANIFEST_TTL = float(os.getenv("MANIFEST_TTL", "300"))
+MANIFEST_RETRY = 30.0
+# Manifest fetches in flight at once during a refresh
+MANIFEST_CONCURRENCY = 16
+
+# Used when no SHOPS_CONFIG is set
+DEFAULT_SHOPS = [
+    {"id": "ucp_flower_shop", "name": "UCP Flower Shop", "url": "http://localhost:8183", "description": "Main shop with varied selection"},
+    {"id": "garden_paradise", "name": "Garden Paradise", "url": "http://localhost:8184", "description": "Budget-friendly flowers"},
+    {"id": "luxury_blooms", "name": "Luxury Blooms", "url": "http://localhost:8185", "description": "Premium flowers for special occasions"},
+    {"id": "green_thumb", "name": "Green Thumb Plants", "url": "http://localhost:8186", "description": "Indoor plants and succulents"},
+]
+
+MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+def _shop_id(url: str) -> str:
+    """Stable ID for a shop configured without one, derived from its URL."""
+    parts = urlsplit(url)
+    return re.sub(r"\W+", "_", parts.netloc + parts.path).strip("_")
+
+
+def _shop_config(config: dict) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """A config entry's url, id, name and description; raises if it has no URL."""
+    if not isinstance(config["url"], str):
+        raise TypeError(f"Shop URL must be a string: {config['url']!r}")
+    return config["url"], config.get("id"), config.get("name"), config.get("description")
+
+
+@dataclass
+class ShopEntry:
+    """A registered shop and what its manifest says about it."""
+
+    id: str
+    url: str
+    # Names and descriptions from the config win over the manifest's
+    configured_name: Optional[str] = None
+    configured_description: Optional[str] = None
+    manifest: Optional[dict] = None
+    etag: Optional[str] = None
+    expires_at: float = 0.0
+    capabilities: List[str] = field(default_factory=list)
+    # Catalog summary used to skip the shop for searches it cannot match;
+    # None when the shop does not publish one
+    summary: Optional[CatalogSummary] = None
+    summary_etag: Optional[str] = None
+
+    def to_shop(self) -> dict:
+        merchant = (self.manifest or {}).get("merchant", {})
+        return {
+            "id": self.id,
+            "name": self.configured_name or merchant.get("name") or self.url,
+            "url": self.url,
+            "description": self.configured_description or merchant.get("description", ""),
+            "capabilities": self.capabilities,
+        }
+
+
+class ShopRegistry:
+    """The federation's shops, loaded from config and described by their manifests.
+
+    Shops come from SHOPS_CONFIG (re-read when it changes) plus any added
+    at runtime with add(). Each shop's /.well-known/ucp manifest is cached
+    and revalidated with If-None-Match once its max-age runs out, by
+    refresh() in the background, so searches never fetch manifests.
+    Catalog summaries change with the catalog, so they are revalidated on
+    every refresh; a summary can lag the shop by up to `interval` seconds.
+    """
+
+    def __init__(
+        self,
+        config_path: Optional[str] = SHOPS_CONFIG,
+        default_shops: List[dict] = DEFAULT_SHOPS,
+        transport: ShopTransport = shop_transport,
+        interval: float = REGISTRY_REFRESH_INTERVAL,
+    ):
+        self.config_path = Path(config_path) if config_path else None
+        self.default_shops = default_shops
+        self.transport = transport
+        self.interval = interval
+        self.entries: Dict[str, ShopEntry] = {}
+        self._configured: set[str] = set()
+        self._config_signature: Optional[Tuple] = None
+        self._shops: Optional[List[dict]] = None
+        self._task: Optional[asyncio.Task] = None
+        # A bad config leaves the registry empty until it is fixed; the
+        # registry is built at import, so this must not raise
+        self._reload_config()
+
+    @property
+    def shops(self) -> List[dict]:
+        """Current shops, in registration order. Do not modify."""
+        if self._shops is None:
+            self._shops = [entry.to_shop() for entry in self.entries.values()]
+        return self._shops
+
+    def get(self, shop_id: str) -> Optional[dict]:
+        entry = self.entries.get(shop_id)
+        return entry.to_shop() if entry else None
+
+    def summary(self, shop_id: str) -> Optional[CatalogSummary]:
+        entry = self.entries.get(shop_id)
+        return entry.summary if entry else None
+
+    def _config_files(self) -> List[Path]:
+        if self.config_path.is_dir():
+            return sorted(self.config_path.glob("*.json"))
+        return [self.config_path]
+
+    def load_config(self) -> bool:
+        """Sync configured shops with the config; returns True if it changed.
+
+        Shops added with add() are kept.
+        """
+        if self.config_path is None:
+            if self._config_signature is not None:
+                return False
+            configs = list(self.default_shops)
+            signature = ()
+        else:
+            files = self._config_files()
+            signature = tuple((str(f), f.stat().st_mtime_ns) for f in files if f.exists())
+            if signature == self._config_signature:
+                return False
+            configs = []
+            for path, _ in signature:
+                data = json.loads(Path(path).read_text())
+                if isinstance(data, dict):
+                    data = data.get("shops", [data])
+                configs.extend(data)
+
+        # Check every entry before registering any, so a bad config is not
+        # half-applied; it is retried until it loads
+        shops = [_shop_config(config) for config in configs]
+        configured = {self._register(*shop).id for shop in shops}
+        for shop_id in self._configured - configured:
+            self.entries.pop(shop_id, None)
+        self._configured = configured
+        self._config_signature = signature
+        self._shops = None
+        return True
+
+    def _reload_config(self) -> None:
+        """load_config(), logging a missing or malformed config instead of raising."""
+        try:
+            self.load_config()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading shop config {self.config_path}: {e}")
+
+    def _register(
+        self,
+        url: str,
+        shop_id: Optional[str],
+        name: Optional[str],
+        description: Optional[str],
+    ) -> ShopEntry:
+        url = url.rstrip("/")
+        shop_id = shop_id or _shop_id(url)
+        entry = self.entries.get(shop_id)
+        if entry is None or entry.url != url:
+            entry = self.entries[shop_id] = ShopEntry(shop_id, url)
+        entry.configured_name = name
+        entry.configured_description = description
+        self._shops = None
+        return entry
+
+    def add(
+        self,
+        url: str,
+        shop_id: Optional[str] = None,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> dict:
+        """Register a shop at runtime; its manifest is fetched on the next refresh."""
+        return self._register(url, shop_id, name, description).to_shop()
+
+    def remove(self, shop_id: str) -> bool:
+        """Unregister a shop; returns False if it was not registered."""
+        self._configured.discard(shop_id)
+        self._shops = None
+        return self.entries.pop(shop_id, None) is not None
+
+    async def refresh(self) -> None:
+        """Reload the config, revalidate expired manifests and every summary."""
+        self._reload_config()
+        now = time.monotonic()
+        expired = {entry.id for entry in self.entries.values() if entry.expires_at <= now}
+        semaphore = asyncio.Semaphore(MANIFEST_CONCURRENCY)
+
+        async def revalidate(entry: ShopEntry) -> None:
+            async with semaphore:
+                if entry.id in expired:
+                    await self._fetch_manifest(entry)
+                await self._fetch_summary(entry)
+
+        await asyncio.gather(*(revalidate(entry) for entry in list(self.entries.values())))
+
+    async def _fetch_manifest(self, entry: ShopEntry) -> None:
+        headers = {"If-None-Match": entry.etag} if entry.etag else {}
+        try:
+            client = self.transport.client(entry.url)
+            response = await client.get(f"{entry.url}/.well-known/ucp", headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+                entry.manifest = response.json()
+                entry.etag = response.headers.get("ETag")
+                capabilities = entry.manifest.get("ucp", {}).get("capabilities", [])
+                entry.capabilities = [
+                    c["name"] if isinstance(c, dict) else c for c in capabilities
+                ]
+                self._shops = None
+            max_age = MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+            ttl = int(max_age.group(1)) if max_age else MANIFEST_TTL
+        except Exception as e:
+            print(f"Error fetching manifest of {entry.url}: {e}")
+            ttl = MANIFEST_RETRY
+        entry.expires_at = time.monotonic() + ttl
+
+    async def _fetch_summary(self, entry: ShopEntry) -> None:
+        headers = {"If-None-Match": entry.summary_etag} if entry.summary_etag else {}
+        try:
+            client = self.transport.client(entry.url)
+            response = await client.get(f"{entry.url}/products/summary", headers=headers)
+            if response.status_code == 304:
+                return
+            response.raise_for_status()
+            entry.summary = CatalogSummary(response.json())
+            entry.summary_etag = response.headers.get("ETag")
+        except Exception as e:
+            # Without a summary the shop is searched for everything
+            if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404):
+                print(f"Error fetching summary of {entry.url}: {e}")
+            entry.summary = entry.summary_etag = None
+
+    def start(self) -> None:
+        """Refresh in the background every `interval` seconds."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+
+# Shared by every agent in the process
+shop_registry = ShopRegistry()
@@ -0,0 +1,168 @@
+"""Local replica of every shop's catalog, kept in sync in the background."""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+
+from src.catalog import CatalogStore, SearchMode
+
+from .registry import ShopRegistry
+from .transport import ShopTransport, shop_transport
+
+# Replica mode is opt-in; the server starts the sync task when enabled
+FEDERATION_REPLICA = os.getenv("FEDERATION_REPLICA", "0") == "1"
+# Seconds between syncs, and the age past which a shop is queried live again
+REPLICA_SYNC_INTERVAL = float(os.getenv("REPLICA_SYNC_INTERVAL", "15"))
+REPLICA_MAX_STALENESS = float(os.getenv("REPLICA_MAX_STALENESS", "60"))
+
+
+@dataclass
+class ShopReplica:
+    """One shop's catalog as of a catalog version."""
+
+    store: CatalogStore
+    # Shop catalog version to follow the change feed from; None when the
+    # shop does not publish one and is reloaded in full every sync
+    version: Optional[int]
+    synced_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.synced_at
+
+
+class FederationReplica:
+    """Merged in-memory index of every shop's catalog.
+
+    Each shop is loaded from /products/export and then follows
+    /products/changes, falling back to a full reload when the shop asks for
+    a resync or has no change feed. Searches are answered locally for shops
+    synced within max_staleness seconds; search() returns None for the
+    others so the caller can query them live.
+    """
+
+    def __init__(
+        self,
+        transport: ShopTransport = shop_transport,
+        interval: float = REPLICA_SYNC_INTERVAL,
+        max_staleness: float = REPLICA_MAX_STALENESS,
+    ):
+        self.transport = transport
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.replicas: Dict[str, ShopReplica] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, registry: ShopRegistry) -> None:
+        """Start syncing the registry's shops in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(registry))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, registry: ShopRegistry) -> None:
+        while True:
+            shops = registry.shops
+            # Drop replicas of shops that have left the registry
+            for shop_id in self.replicas.keys() - {shop["id"] for shop in shops}:
+                del self.replicas[shop_id]
+            await asyncio.gather(*(self.sync(shop) for shop in shops))
+            await asyncio.sleep(self.interval)
+
+    async def sync(self, shop: dict) -> None:
+        """Bring one shop's replica up to date; errors leave it as it was."""
+        try:
+            replica = self.replicas.get(shop["id"])
+            if replica is None or replica.version is None or not await self._apply_changes(shop, replica):
+                self.replicas[shop["id"]] = await self._load(shop)
+        except Exception as e:
+            print(f"Error syncing replica of {shop['name']}: {e}")
+
+    async def _load(self, shop: dict) -> ShopReplica:
+        """Load a shop's full catalog from its export."""
+        client = self.transport.client(shop["url"])
+        async with client.stream("GET", f"{shop['url']}/products/export") as response:
+            response.raise_for_status()
+            version = response.headers.get("X-Catalog-Version")
+            products = [json.loads(line) async for line in response.aiter_lines() if line]
+        # Building the columns and index is CPU-bound; keep it off the event loop
+        store = await asyncio.to_thread(CatalogStore, products)
+        return ShopReplica(store, int(version) if version is not None else None)
+
+    async def _apply_changes(self, shop: dict, replica: ShopReplica) -> bool:
+        """Apply the shop's changes since the replica's version.
+
+        Returns False when the replica has to be reloaded instead.
+        """
+        client = self.transport.client(shop["url"])
+        response = await client.get(
+            f"{shop['url']}/products/changes", params={"since": replica.version}
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        changes = response.json()
+        if changes["resync"]:
+            return False
+        for product in changes["upserts"]:
+            replica.store.upsert(product)
+        for product_id in changes["deletes"]:
+            replica.store.delete(product_id)
+        replica.version = changes["version"]
+        replica.synced_at = time.monotonic()
+        return True
+
+    def search(
+        self,
+        shop: dict,
+        query: str = "",
+        max_price: Optional[float] = None,
+        category: Optional[str] = None,
+        limit: int = 10,
+        mode: SearchMode = "auto",
+    ) -> Optional[dict]:
+        """Search a shop's replica like its /products/search would.
+
+        Returns None when the shop has no replica fresh enough to use.
+        """
+        replica = self.replicas.get(shop["id"])
+        if replica is None or replica.age > self.max_staleness:
+            return None
+        store = replica.store
+        rows = store.query(query, max_price, category, "price_asc", mode)
+        products = store.rows(rows[:limit])
+        for p in products:
+            p["shop_name"] = shop["name"]
+            p["shop_url"] = shop["url"]
+        return {
+            "products": products,
+            "total": len(rows),
+            "facets": store.facets(rows),
+            "freshness": {
+                "source": "replica",
+                "version": replica.version,
+                "age_seconds": round(replica.age, 1),
+            },
+        }
+
+    def is_fresh(self, shops: Iterable[dict]) -> bool:
+        """Whether every shop can be answered from the replica."""
+        return all(
+            shop["id"] in self.replicas
+            and self.replicas[shop["id"]].age <= self.max_staleness
+            for shop in shops
+        )
+
+
+# Shared by every agent in the process
+federation_replica = FederationReplica()
@@ -0,0 +1,110 @@
+"""Deadlines, hedged requests and circuit breakers for calls to shops."""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Literal, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Budget for a whole federated search; shops still pending are left out
+FEDERATION_DEADLINE = float(os.getenv("FEDERATION_DEADLINE", "4"))
+# A second copy of a request is sent if the first has not answered by then
+SHOP_HEDGE_DELAY = float(os.getenv("SHOP_HEDGE_DELAY", "0.5"))
+# Consecutive failures that open a shop's breaker, and seconds it stays open
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+
+class CircuitBreaker:
+    """Stops sending requests to a shop that keeps failing.
+
+    After `failures` consecutive failures the breaker opens and the shop is
+    skipped. Once `reset_after` seconds have passed, a single trial request
+    is let through: success closes the breaker, failure opens it again,
+    and release() (for a cancelled request) lets the next one be a trial.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> BreakerState:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._trial_running or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release(self) -> None:
+        """Give up a request let through by allow() without an outcome.
+
+        Call it when the request is cancelled, so a half-open breaker can
+        let another trial through instead of waiting forever.
+        """
+        self._trial_running = False
+
+
+# One breaker per shop ID, shared by every agent in the process
+circuit_breakers: Dict[str, CircuitBreaker] = defaultdict(CircuitBreaker)
+
+
+async def hedged(
+    request: Callable[[], Awaitable[T]], delay: float = SHOP_HEDGE_DELAY, copies: int = 2
+) -> T:
+    """Await request(), sending another copy if it is slow or fails.
+
+    A new copy starts when none has answered after `delay` seconds, or
+    right away when one fails, up to `copies` in total. The first success
+    wins and the others are cancelled; if every copy fails the last error
+    is raised. Only use for idempotent requests.
+    """
+    pending = {asyncio.ensure_future(request())}
+    started = 1
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if started < copies else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if started < copies:
+                pending.add(asyncio.ensure_future(request()))
+                started += 1
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
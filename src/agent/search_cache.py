@@ -0,0 +1,218 @@
+"""Cache for federated search results with stale-while-revalidate."""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from src.catalog import tokenize
+
+# Results are fresh for SEARCH_CACHE_TTL seconds, then served stale (while
+# refreshed in the background) for up to SEARCH_CACHE_STALE seconds more
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "30"))
+SEARCH_CACHE_STALE = float(os.getenv("SEARCH_CACHE_STALE", "300"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+# Partial results (some shop left out) are kept this long, and never served
+# stale, so an outage costs one fan-out per query per interval
+SEARCH_CACHE_PARTIAL_TTL = float(os.getenv("SEARCH_CACHE_PARTIAL_TTL", "5"))
+
+
+def search_key(
+    query: str = "",
+    max_price: Optional[float] = None,
+    category: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> tuple:
+    """Normalize search arguments so equivalent searches share an entry.
+
+    Queries are compared token by token, the way shops match them, so case,
+    punctuation and repeated words do not matter. Term order is kept because
+    typo-tolerant matching can join adjacent terms.
+    """
+    return (
+        tuple(dict.fromkeys(tokenize(query or ""))),
+        float(max_price) if max_price else None,
+        category or None,
+        limit,
+    )
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+class SearchCache:
+    """LRU cache of search results with TTL, background refresh and coalescing.
+
+    A fresh entry is returned as is. A stale entry is returned immediately
+    while one background task refreshes it. On a miss, concurrent callers
+    with the same key share a single fetch. Incomplete values are only
+    kept for partial_ttl seconds, and do not replace a complete entry that
+    can still be served.
+    """
+
+    def __init__(
+        self,
+        ttl: float = SEARCH_CACHE_TTL,
+        stale_ttl: float = SEARCH_CACHE_STALE,
+        max_entries: int = SEARCH_CACHE_SIZE,
+        partial_ttl: float = SEARCH_CACHE_PARTIAL_TTL,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.partial_ttl = partial_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._refreshes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.partial_stores = 0
+
+    async def get(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        complete: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        """Return the cached value for key, calling fetch() when needed.
+
+        Fetched values that fail `complete` are returned (and shared with
+        coalesced callers) but only cached for partial_ttl seconds.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry.stale_until:
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    self._refresh(key, fetch, complete)
+            return entry.value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._start(key, fetch, complete)
+        else:
+            self.coalesced += 1
+        # A caller giving up (e.g. on timeout) does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def needs_fetch(self, key: Hashable) -> bool:
+        """Whether get(key) would start a fetch: a miss, or a stale entry
+        that is not being refreshed."""
+        if key in self._inflight:
+            return False
+        entry = self._entries.get(key)
+        return entry is None or time.monotonic() >= entry.fresh_until
+
+    def start_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        complete: Callable[[Any], bool] = lambda value: True,
+    ) -> Optional[asyncio.Task]:
+        """Start the fetch get(key) would, for a key that needs_fetch(key).
+
+        For callers fetching several keys at once: get(key) calls made
+        meanwhile share the fetch. A stale entry is refreshed in the
+        background and None is returned, since get(key) answers at once.
+        Otherwise the fetch counts as a miss and its task is returned;
+        await it through asyncio.shield, as get() does, so giving up does
+        not cancel it.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry.stale_until:
+            self._refresh(key, fetch, complete)
+            return None
+        self.misses += 1
+        return self._start(key, fetch, complete)
+
+    def _refresh(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        complete: Callable[[Any], bool],
+    ) -> None:
+        refresh = self._start(key, fetch, complete)
+        self._refreshes.add(refresh)
+        refresh.add_done_callback(self._refresh_done)
+
+    def _start(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        complete: Callable[[Any], bool],
+    ) -> asyncio.Task:
+        task = asyncio.ensure_future(self._fetch(key, fetch, complete))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        complete: Callable[[Any], bool],
+    ) -> Any:
+        value = await fetch()
+        now = time.monotonic()
+        if complete(value):
+            entry = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        else:
+            current = self._entries.get(key)
+            if current is not None and now < current.stale_until:
+                # Keep serving the last complete value while it lasts, and
+                # only retry after partial_ttl
+                current.fresh_until = min(now + self.partial_ttl, current.stale_until)
+                return value
+            entry = _Entry(value, now + self.partial_ttl, now + self.partial_ttl)
+            self.partial_stores += 1
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # The stale entry is kept; the next request past it fetches again
+            print(f"Error refreshing cached search: {task.exception()}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache.
+
+        hit_rate counts every lookup that did not start its own fan-out.
+        """
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "partial_stores": self.partial_stores,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else None,
+        }
+
+
+# Shared by every agent in the process
+search_cache = SearchCache()
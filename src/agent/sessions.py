@@ -0,0 +1,107 @@
+"""Per-shopper chat sessions with LRU and idle eviction."""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .federation_agent import FederationAgent
+
+# Sessions kept at once, and seconds of inactivity before one is dropped
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+
+
+@dataclass
+class ChatSession:
+    """One shopper's conversation."""
+
+    agent: FederationAgent
+    # Held for a whole turn, so a shopper's messages are answered in order
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionManager:
+    """Chat sessions by session ID, each with its own agent and history.
+
+    Agents come from agent_factory, which should share the expensive parts
+    (the Gemini client, the federated search) between them. Sessions idle
+    for longer than idle_ttl are dropped, and past max_sessions the least
+    recently used are dropped too, unless a turn is in progress.
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], FederationAgent],
+        max_sessions: int = CHAT_MAX_SESSIONS,
+        idle_ttl: float = CHAT_SESSION_TTL,
+    ):
+        self.agent_factory = agent_factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> ChatSession:
+        """The session for session_id, started if it does not exist."""
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_used > self.idle_ttl and not session.lock.locked():
+            del self._sessions[session_id]
+            self.expired += 1
+            session = None
+        if session is None:
+            session = self._sessions[session_id] = ChatSession(self.agent_factory())
+            self.created += 1
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        self._evict(now, keep=session_id)
+        return session
+
+    def find(self, session_id: str) -> Optional[ChatSession]:
+        """The live session for session_id, or None; never starts or renews one."""
+        session = self._sessions.get(session_id)
+        if session is None or (
+            time.monotonic() - session.last_used > self.idle_ttl and not session.lock.locked()
+        ):
+            return None
+        return session
+
+    def _evict(self, now: float, keep: str) -> None:
+        # Least recently used first, so idle sessions are at the front
+        overflow = len(self._sessions) - self.max_sessions
+        victims = []
+        for session_id, session in self._sessions.items():
+            if session_id == keep:
+                break
+            if session.lock.locked():
+                continue
+            if now - session.last_used > self.idle_ttl:
+                self.expired += 1
+            elif len(victims) < overflow:
+                self.evictions += 1
+            else:
+                break
+            victims.append(session_id)
+        for session_id in victims:
+            del self._sessions[session_id]
+
+    def reset(self, session_id: str) -> bool:
+        """End a session; returns False if there was none."""
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "active": sum(session.lock.locked() for session in self._sessions.values()),
+            "created": self.created,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
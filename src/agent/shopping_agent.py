@@ -2,13 +2,15 @@
 
 import json
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
 from .client import UCPClient
+from .history import HistoryManager
 from .tools import UCP_TOOLS
 
 load_dotenv()
@@ -16,6 +18,14 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MODEL_ID = "models/gemini-2.5-flash"
 
+# Tool results are read by the model: indentation only costs tokens
+JSON_SEPARATORS = (",", ":")
+# Threads running the read-only function calls of one model turn concurrently
+TOOL_WORKERS = 4
+# Tools that change nothing, so their calls can run in any order; checkout
+# calls run one at a time, in the order the model made them
+READ_ONLY_TOOLS = frozenset({"list_products", "get_product_details", "get_order"})
+
 SYSTEM_PROMPT = """You are a helpful shopping assistant for a flower shop powered by the Universal Commerce Protocol (UCP).
 
 Your capabilities:
@@ -45,7 +55,10 @@ class ShoppingAgent:
         
         self.client = genai.Client(api_key=self.api_key)
         self.ucp_client = UCPClient()
-        self.chat_history: list[types.Content] = []
+        # UCPClient is blocking; a turn's read-only calls run side by side here
+        self.tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS)
+        # Sent with every request, compacted to a token budget
+        self.history = HistoryManager()
         self.current_checkout_id: Optional[str] = None
         
     def _execute_tool(self, function_call: types.FunctionCall) -> str:
@@ -56,16 +69,19 @@ class ShoppingAgent:
         try:
             if name == "list_products":
                 products = self.ucp_client.get_products()
-                return json.dumps({"products": products}, indent=2)
+                return json.dumps({"products": products}, separators=JSON_SEPARATORS)
             
             elif name == "get_product_details":
-                products = self.ucp_client.get_products()
-                product = next(
-                    (p for p in products if p["id"] == args["product_id"]), 
-                    None
-                )
-                if product:
-                    return json.dumps(product, indent=2)
+                product_ids = list(args.get("product_ids") or [args["product_id"]])
+                products = self.ucp_client.get_products_by_ids(product_ids)
+                if len(product_ids) > 1:
+                    found = {p["id"] for p in products}
+                    return json.dumps({
+                        "products": products,
+                        "missing": [i for i in product_ids if i not in found],
+                    }, separators=JSON_SEPARATORS)
+                if products:
+                    return json.dumps(products[0], separators=JSON_SEPARATORS)
                 return json.dumps({"error": "Product not found"})
             
             elif name == "create_checkout":
@@ -74,7 +90,7 @@ class ShoppingAgent:
                     quantity=args.get("quantity", 1),
                 )
                 self.current_checkout_id = result["id"]
-                return json.dumps(result, indent=2)
+                return json.dumps(result, separators=JSON_SEPARATORS)
             
             elif name == "update_checkout":
                 result = self.ucp_client.update_checkout(
@@ -84,17 +100,17 @@ class ShoppingAgent:
                     shipping_address=args.get("shipping_address"),
                     shipping_method=args.get("shipping_method"),
                 )
-                return json.dumps(result, indent=2)
+                return json.dumps(result, separators=JSON_SEPARATORS)
             
             elif name == "complete_checkout":
                 result = self.ucp_client.complete_checkout(
                     checkout_id=args["checkout_id"],
                 )
-                return json.dumps(result, indent=2)
+                return json.dumps(result, separators=JSON_SEPARATORS)
             
             elif name == "get_order":
                 result = self.ucp_client.get_order(order_id=args["order_id"])
-                return json.dumps(result, indent=2)
+                return json.dumps(result, separators=JSON_SEPARATORS)
             
             else:
                 return json.dumps({"error": f"Unknown function: {name}"})
@@ -102,10 +118,32 @@ class ShoppingAgent:
         except Exception as e:
             return json.dumps({"error": str(e)})
 
+    def _execute_tools(self, function_calls: List[types.FunctionCall]) -> List[str]:
+        """Execute a turn's function calls; returns their results in order.
+
+        Consecutive read-only calls run concurrently on the tool pool.
+        Checkout calls are not idempotent and depend on each other, so each
+        runs alone on this thread, after the calls the model made before it.
+        """
+        results = []
+        reads = []
+        for function_call in [*function_calls, None]:
+            if function_call is not None and function_call.name in READ_ONLY_TOOLS:
+                reads.append(function_call)
+                continue
+            if len(reads) > 1:
+                results.extend(self.tool_pool.map(self._execute_tool, reads))
+            else:
+                results.extend(self._execute_tool(read) for read in reads)
+            reads = []
+            if function_call is not None:
+                results.append(self._execute_tool(function_call))
+        return results
+
     def chat(self, user_message: str) -> str:
         """Send a message and get a response from the agent."""
         # Add user message to history
-        self.chat_history.append(
+        self.history.append(
             types.Content(
                 role="user",
                 parts=[types.Part(text=user_message)],
@@ -115,7 +153,7 @@ class ShoppingAgent:
         # Generate response
         response = self.client.models.generate_content(
             model=MODEL_ID,
-            contents=self.chat_history,
+            contents=self.history.for_request(),
             config=types.GenerateContentConfig(
                 system_instruction=SYSTEM_PROMPT,
                 tools=[UCP_TOOLS],
@@ -124,48 +162,52 @@ class ShoppingAgent:
 
         # Handle function calls
         while response.candidates[0].content.parts:
-            part = response.candidates[0].content.parts[0]
+            function_calls = [
+                part.function_call
+                for part in response.candidates[0].content.parts
+                if part.function_call
+            ]
+            if not function_calls:
+                break
             
-            if part.function_call:
-                # Execute the function
-                function_call = part.function_call
-                result = self._execute_tool(function_call)
-                
-                # Add assistant's function call to history
-                self.chat_history.append(response.candidates[0].content)
-                
-                # Add function result to history
-                self.chat_history.append(
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part(
-                                function_response=types.FunctionResponse(
-                                    name=function_call.name,
-                                    response={"result": result},
-                                )
+            # Execute every function of the turn
+            results = self._execute_tools(function_calls)
+            
+            # Add assistant's function calls to history
+            self.history.append(response.candidates[0].content)
+            
+            # Add all function results to history, in one message
+            self.history.append(
+                types.Content(
+                    role="user",
+                    parts=[
+                        types.Part(
+                            function_response=types.FunctionResponse(
+                                id=function_call.id,
+                                name=function_call.name,
+                                response={"result": result},
                             )
-                        ],
-                    )
+                        )
+                        for function_call, result in zip(function_calls, results)
+                    ],
                 )
-                
-                # Get next response
-                response = self.client.models.generate_content(
-                    model=MODEL_ID,
-                    contents=self.chat_history,
-                    config=types.GenerateContentConfig(
-                        system_instruction=SYSTEM_PROMPT,
-                        tools=[UCP_TOOLS],
-                    ),
-                )
-            else:
-                break
+            )
+            
+            # Get next response
+            response = self.client.models.generate_content(
+                model=MODEL_ID,
+                contents=self.history.for_request(),
+                config=types.GenerateContentConfig(
+                    system_instruction=SYSTEM_PROMPT,
+                    tools=[UCP_TOOLS],
+                ),
+            )
         
         # Extract text response
         assistant_text = response.text if response.text else "I'm sorry, I couldn't process that request."
         
         # Add assistant response to history
-        self.chat_history.append(
+        self.history.append(
             types.Content(
                 role="model",
                 parts=[types.Part(text=assistant_text)],
@@ -176,11 +218,12 @@ class ShoppingAgent:
 
     def reset(self):
         """Reset the conversation history."""
-        self.chat_history = []
+        self.history.clear()
         self.current_checkout_id = None
 
     def close(self):
         """Clean up resources."""
+        self.tool_pool.shutdown()
         self.ucp_client.close()
 
 
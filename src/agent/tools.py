@@ -16,7 +16,7 @@ LIST_PRODUCTS = types.FunctionDeclaration(
 
 GET_PRODUCT_DETAILS = types.FunctionDeclaration(
     name="get_product_details",
-    description="Get detailed information about a specific product by its ID.",
+    description="Get detailed information about products by ID. Pass product_ids to look up several products in one call.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
@@ -24,8 +24,12 @@ GET_PRODUCT_DETAILS = types.FunctionDeclaration(
                 type=types.Type.STRING,
                 description="The product ID (e.g., 'prod_001')",
             ),
+            "product_ids": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                description="Several product IDs to look up at once",
+            ),
         },
-        required=["product_id"],
     ),
 )
 
@@ -0,0 +1,68 @@
+"""Shared, pooled async HTTP transport for requests to UCP shops."""
+
+import importlib.util
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+# Per-shop connection pool limits
+SHOP_MAX_CONNECTIONS = int(os.getenv("SHOP_MAX_CONNECTIONS", "20"))
+SHOP_MAX_KEEPALIVE = int(os.getenv("SHOP_MAX_KEEPALIVE", "10"))
+SHOP_KEEPALIVE_EXPIRY = float(os.getenv("SHOP_KEEPALIVE_EXPIRY", "30"))
+SHOP_TIMEOUT = httpx.Timeout(10.0, connect=3.0)
+
+# HTTP/2 is negotiated with https shops when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+SHOP_HTTP2 = os.getenv("SHOP_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+
+
+class ShopTransport:
+    """Long-lived HTTP clients, one connection pool per shop origin.
+
+    Connections are kept alive between searches, so a fan-out costs one
+    request round trip per shop instead of a connect plus a request. Each
+    origin gets its own pool, so a slow shop cannot take up the connections
+    of the others. Clients are created on first use and closed by aclose(),
+    which the server calls on shutdown.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = SHOP_MAX_CONNECTIONS,
+        max_keepalive: int = SHOP_MAX_KEEPALIVE,
+        keepalive_expiry: float = SHOP_KEEPALIVE_EXPIRY,
+        timeout: httpx.Timeout = SHOP_TIMEOUT,
+        http2: bool = SHOP_HTTP2,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.http2 = http2
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """Pooled client for the origin of url."""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, http2=self.http2
+            )
+            self._clients[origin] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close every pooled connection."""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+# Shared by every agent in the process
+shop_transport = ShopTransport()
@@ -0,0 +1,62 @@
+"""Catalog engine shared by the UCP shop servers."""
+
+from .batch import BatchSearchRequest, SearchQuery
+from .changes import CHANGE_LOG_SIZE, ChangeLog, ChangeOp, build_changes
+from .export import EXPORT_CHUNK_ROWS, NDJSON_MEDIA_TYPE, aiter_ndjson, iter_ndjson
+from .facets import PRICE_BUCKET_EDGES, FacetAccumulator, price_bucket
+from .fuzzy import FuzzyMatcher, SearchMode, combine_term_costs, fuzzy_terms
+from .grouping import ProductGroups, group_key
+from .pagination import (
+    MAX_BATCH_IDS,
+    MAX_BATCH_QUERIES,
+    MAX_PAGE_SIZE,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+    query_fingerprint,
+)
+from .search_index import SearchIndex, matches_query, tokenize
+from .store import CatalogChanged, CatalogStore, SortOrder
+from .summary import MIN_PREFIX, BloomFilter, CatalogSummary, build_summary, query_terms
+
+__all__ = [
+    "CHANGE_LOG_SIZE",
+    "EXPORT_CHUNK_ROWS",
+    "MAX_BATCH_IDS",
+    "MAX_BATCH_QUERIES",
+    "MAX_PAGE_SIZE",
+    "MIN_PREFIX",
+    "NDJSON_MEDIA_TYPE",
+    "PRICE_BUCKET_EDGES",
+    "BatchSearchRequest",
+    "BloomFilter",
+    "CatalogChanged",
+    "CatalogStore",
+    "CatalogSummary",
+    "ChangeLog",
+    "ChangeOp",
+    "FacetAccumulator",
+    "FuzzyMatcher",
+    "InvalidCursor",
+    "ProductGroups",
+    "SearchIndex",
+    "SearchMode",
+    "SearchQuery",
+    "SortOrder",
+    "aiter_ndjson",
+    "build_changes",
+    "build_summary",
+    "combine_term_costs",
+    "decode_cursor",
+    "encode_cursor",
+    "fuzzy_terms",
+    "group_key",
+    "iter_ndjson",
+    "matches_query",
+    "paginate",
+    "price_bucket",
+    "query_fingerprint",
+    "query_terms",
+    "tokenize",
+]
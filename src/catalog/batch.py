@@ -0,0 +1,25 @@
+"""Request bodies for batch searches, shared by the shop servers."""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from .fuzzy import SearchMode
+from .pagination import MAX_BATCH_QUERIES, MAX_PAGE_SIZE
+from .store import SortOrder
+
+
+class SearchQuery(BaseModel):
+    """One query of a batch search."""
+    q: str = ""
+    max_price: Optional[float] = None
+    category: Optional[str] = None
+
+
+class BatchSearchRequest(BaseModel):
+    """Body of POST /products/search/batch; options apply to every query."""
+    queries: List[SearchQuery] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    limit: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE)
+    sort: Optional[SortOrder] = None
+    facets: bool = False
+    mode: SearchMode = "exact"
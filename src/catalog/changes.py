@@ -0,0 +1,61 @@
+"""Bounded change log behind the incremental catalog feed."""
+
+from collections import deque
+from typing import Deque, Iterable, Literal, Optional, Tuple
+
+# Changes kept per catalog; consumers further behind must resync from export
+CHANGE_LOG_SIZE = 1000
+
+ChangeOp = Literal["upsert", "delete"]
+
+
+def build_changes(
+    version: int,
+    since: int,
+    upserts: Iterable[dict] = (),
+    deletes: Iterable[str] = (),
+    resync: bool = False,
+) -> dict:
+    """Response body of /products/changes.
+
+    With resync set the consumer cannot catch up from the log and must
+    reload the whole catalog (e.g. from /products/export).
+    """
+    return {
+        "version": version,
+        "since": since,
+        "resync": resync,
+        "upserts": list(upserts),
+        "deletes": list(deletes),
+    }
+
+
+class ChangeLog:
+    """The most recent catalog changes, each tagged with the version it produced.
+
+    Only the last max_entries changes are kept; floor is the oldest version
+    the log can still replay from.
+    """
+
+    def __init__(self, version: int, max_entries: int = CHANGE_LOG_SIZE):
+        self.entries: Deque[Tuple[int, ChangeOp, str]] = deque(maxlen=max_entries)
+        self.floor = version
+
+    def record(self, version: int, op: ChangeOp, product_id: str) -> None:
+        if len(self.entries) == self.entries.maxlen:
+            self.floor = self.entries[0][0]
+        self.entries.append((version, op, product_id))
+
+    def since(self, version: int) -> Optional[dict[str, ChangeOp]]:
+        """Latest change per product after version, oldest first.
+
+        Returns None when entries after version have been truncated.
+        """
+        if version < self.floor:
+            return None
+        changed: dict[str, ChangeOp] = {}
+        for entry_version, op, product_id in reversed(self.entries):
+            if entry_version <= version:
+                break
+            changed.setdefault(product_id, op)
+        return dict(reversed(changed.items()))
@@ -0,0 +1,35 @@
+"""NDJSON serialization for streaming catalog exports."""
+
+import json
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Rows per chunk written to the response; bounds memory per chunk
+EXPORT_CHUNK_ROWS = 256
+
+
+def iter_ndjson(products: Iterable[dict], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Lazily encode products as newline-delimited JSON chunks."""
+    lines = []
+    for product in products:
+        lines.append(json.dumps(product, separators=(",", ":")))
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def aiter_ndjson(
+    products: AsyncIterable[dict], chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> AsyncIterator[bytes]:
+    """Async variant of iter_ndjson for products read from a database."""
+    lines = []
+    async for product in products:
+        lines.append(json.dumps(product, separators=(",", ":")))
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
@@ -0,0 +1,94 @@
+"""Facet aggregations for product search results."""
+
+from bisect import bisect_right
+from typing import Optional
+
+# Upper bounds of the price histogram buckets; the last bucket is open-ended.
+# Shared by every shop so the federation can merge histograms bucket by bucket.
+PRICE_BUCKET_EDGES = (10.0, 25.0, 50.0, 100.0, 250.0)
+PRICE_BUCKET_COUNT = len(PRICE_BUCKET_EDGES) + 1
+
+
+def price_bucket(price: float) -> int:
+    """Index of the histogram bucket a price falls into."""
+    return bisect_right(PRICE_BUCKET_EDGES, price)
+
+
+class FacetAccumulator:
+    """Category counts, price histogram and price range of a result set.
+
+    Fed with single products, pre-aggregated groups, or other shops'
+    facet dicts, and rendered with to_dict().
+    """
+
+    def __init__(self):
+        self.categories: dict[str, int] = {}
+        self.buckets = [0] * PRICE_BUCKET_COUNT
+        self.min_price: Optional[float] = None
+        self.max_price: Optional[float] = None
+
+    def add_group(
+        self,
+        category: Optional[str],
+        bucket: int,
+        count: int,
+        min_price: float,
+        max_price: float,
+    ) -> None:
+        """Add `count` products of one category and price bucket."""
+        if not count:
+            return
+        if category is not None:
+            self.categories[category] = self.categories.get(category, 0) + count
+        self.buckets[bucket] += count
+        if self.min_price is None or min_price < self.min_price:
+            self.min_price = min_price
+        if self.max_price is None or max_price > self.max_price:
+            self.max_price = max_price
+
+    def add(self, price: float, category: Optional[str]) -> None:
+        """Add a single product."""
+        self.add_group(category, price_bucket(price), 1, price, price)
+
+    def merge(self, facets: Optional[dict]) -> None:
+        """Merge a facet dict produced by another result set."""
+        if not facets:
+            return
+        for category, count in facets.get("categories", {}).items():
+            self.categories[category] = self.categories.get(category, 0) + count
+        for bucket, entry in enumerate(facets.get("price_buckets", [])[:PRICE_BUCKET_COUNT]):
+            self.buckets[bucket] += entry.get("count", 0)
+        price = facets.get("price")
+        if price:
+            if self.min_price is None or price["min"] < self.min_price:
+                self.min_price = price["min"]
+            if self.max_price is None or price["max"] > self.max_price:
+                self.max_price = price["max"]
+
+    def to_dict(self) -> dict:
+        return build_facets(self.categories, self.buckets, self.min_price, self.max_price)
+
+
+def build_facets(
+    category_counts: dict[str, int],
+    bucket_counts,
+    min_price: Optional[float],
+    max_price: Optional[float],
+) -> dict:
+    """Render facet counts in the wire format used by /products/search."""
+    lower_bounds = (0.0,) + PRICE_BUCKET_EDGES
+    upper_bounds = PRICE_BUCKET_EDGES + (None,)
+    return {
+        "categories": {
+            category: int(count)
+            for category, count in category_counts.items()
+            if count and category is not None
+        },
+        "price_buckets": [
+            {"min": lo, "max": hi, "count": int(count)}
+            for lo, hi, count in zip(lower_bounds, upper_bounds, bucket_counts)
+        ],
+        "price": (
+            None if min_price is None else {"min": float(min_price), "max": float(max_price)}
+        ),
+    }
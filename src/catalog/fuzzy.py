@@ -0,0 +1,122 @@
+"""Typo-tolerant term matching with a trigram index."""
+
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Literal, Optional
+
+SearchMode = Literal["exact", "fuzzy", "auto"]
+
+# Sorts after every character a token can contain, used to bound prefix ranges
+PREFIX_END = "\uffff"
+
+
+def max_edits(term: str) -> int:
+    """Edit budget for a query term; short terms must match exactly."""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return 2
+
+
+def trigrams(token: str) -> List[str]:
+    """Boundary-padded character trigrams of a token."""
+    padded = f"^{token}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def bounded_levenshtein(a: str, b: str, max_distance: int) -> Optional[int]:
+    """Levenshtein distance between a and b, or None if above max_distance.
+
+    Stops as soon as every cell in a DP row exceeds the bound.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+        if min(current) > max_distance:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+class FuzzyMatcher:
+    """Expands query terms to vocabulary tokens within a small edit distance."""
+
+    def __init__(self, vocabulary: Iterable[str]):
+        self.vocabulary = sorted(set(vocabulary))
+        self.trigram_postings: Dict[str, List[int]] = {}
+        for token_id, token in enumerate(self.vocabulary):
+            for gram in set(trigrams(token)):
+                self.trigram_postings.setdefault(gram, []).append(token_id)
+
+    def expand(self, term: str) -> Dict[str, int]:
+        """Map each token the term can match to its edit distance.
+
+        Tokens the term is a prefix of match at distance 0. Other tokens are
+        shortlisted by shared trigrams (an edit changes at most three) and
+        verified with a bounded edit distance.
+        """
+        lo = bisect_left(self.vocabulary, term)
+        hi = bisect_left(self.vocabulary, term + PREFIX_END, lo)
+        matches = {token: 0 for token in self.vocabulary[lo:hi]}
+
+        edits = max_edits(term)
+        if not edits:
+            return matches
+        shared = Counter(
+            token_id
+            for gram in set(trigrams(term))
+            for token_id in self.trigram_postings.get(gram, ())
+        )
+        needed = len(term) - 3 * edits
+        for token_id, count in shared.items():
+            token = self.vocabulary[token_id]
+            if count < needed or token in matches:
+                continue
+            distance = bounded_levenshtein(term, token, edits)
+            if distance is not None:
+                matches[token] = distance
+        return matches
+
+
+def fuzzy_terms(terms: List[str]) -> List[str]:
+    """Terms to look up for a fuzzy query: each term and each adjacent pair joined.
+
+    Joining lets "sun flower" match "sunflower".
+    """
+    joined = [a + b for a, b in zip(terms, terms[1:])]
+    return list(dict.fromkeys(terms + joined))
+
+
+def combine_term_costs(terms: List[str], costs: Dict[str, Dict[int, int]]) -> Dict[int, int]:
+    """Rows matching every term, mapped to their total edit distance.
+
+    costs maps each term from fuzzy_terms() to the rows it matches and
+    their distance. A pair of adjacent terms may be covered by the joined
+    pair instead of the two terms.
+    """
+    def intersect(left: Dict[int, int], right: Optional[Dict[int, int]]) -> Dict[int, int]:
+        if right is None:
+            return left
+        if len(left) > len(right):
+            left, right = right, left
+        return {row: cost + right[row] for row, cost in left.items() if row in right}
+
+    # best[i] covers terms[i:]; None stands for "every row, at no cost"
+    best: List[Optional[Dict[int, int]]] = [None] * (len(terms) + 1)
+    for i in range(len(terms) - 1, -1, -1):
+        rows = intersect(costs[terms[i]], best[i + 1])
+        if i + 1 < len(terms):
+            for row, cost in intersect(costs[terms[i] + terms[i + 1]], best[i + 2]).items():
+                if cost < rows.get(row, cost + 1):
+                    rows[row] = cost
+        best[i] = rows
+    return best[0] or {}
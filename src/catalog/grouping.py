@@ -0,0 +1,70 @@
+"""Grouping of the same product offered by several shops."""
+
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from .search_index import tokenize
+
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+@lru_cache(maxsize=65536)
+def group_key(name: str, category: Optional[str] = None) -> str:
+    """Key shared by listings of the same product across shops.
+
+    Names are compared by their lower-cased, singularized words, so
+    "Red Roses Bouquet" and "red rose bouquet" group together, and only
+    within the same category.
+    """
+    words = " ".join(_singular(token) for token in tokenize(name))
+    return f"{(category or '').casefold()}:{words}"
+
+
+class ProductGroups:
+    """Offers grouped by product, with their price range.
+
+    Fed with product dicts carrying shop_name, as returned by the federated
+    search. Entries only keep what is needed to compare and show offers.
+    """
+
+    def __init__(self):
+        self.groups: Dict[str, dict] = {}
+
+    def add(self, product: dict) -> None:
+        key = group_key(product.get("name", ""), product.get("category"))
+        price = float(product.get("price", 999))
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {
+                "name": product.get("name"),
+                "category": product.get("category"),
+                "image": product.get("image"),
+                "min_price": price,
+                "max_price": price,
+                "offers": [],
+            }
+        elif price < group["min_price"]:
+            group["min_price"] = price
+            # Describe the group by its cheapest listing
+            group["name"] = product.get("name")
+            group["image"] = product.get("image") or group["image"]
+        group["max_price"] = max(group["max_price"], price)
+        group["offers"].append(
+            {
+                "id": product.get("id"),
+                "price": price,
+                "shop_name": product.get("shop_name"),
+            }
+        )
+
+    def to_list(self, limit: Optional[int] = None) -> List[dict]:
+        """Groups by lowest price, each with its offers cheapest first."""
+        groups = sorted(self.groups.values(), key=lambda group: group["min_price"])[:limit]
+        for group in groups:
+            group["offers"].sort(key=lambda offer: offer["price"])
+            group["shop_count"] = len({offer["shop_name"] for offer in group["offers"]})
+        return groups
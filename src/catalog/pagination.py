@@ -0,0 +1,62 @@
+"""Opaque cursors for paginated product listings."""
+
+import base64
+import hashlib
+import json
+from typing import Optional, Sequence, Tuple
+
+MAX_PAGE_SIZE = 100
+
+# Upper bound on IDs resolved by one batch lookup
+MAX_BATCH_IDS = 100
+
+# Upper bound on queries evaluated by one batch search
+MAX_BATCH_QUERIES = 20
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or belongs to a different query."""
+
+
+def query_fingerprint(*params) -> str:
+    """Short digest of the query parameters a cursor is bound to."""
+    raw = json.dumps(params, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=6).hexdigest()
+
+
+def encode_cursor(offset: int, fingerprint: str) -> str:
+    """Encode a resume position as an opaque, URL-safe token."""
+    raw = json.dumps({"o": offset, "q": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> int:
+    """Decode a cursor and return its offset."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        offset = int(data["o"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if data.get("q") != fingerprint or offset < 0:
+        raise InvalidCursor("Cursor does not match this query")
+    return offset
+
+
+def paginate(
+    rows: Sequence[int],
+    limit: Optional[int],
+    cursor: Optional[str],
+    fingerprint: str,
+) -> Tuple[Sequence[int], Optional[str]]:
+    """Slice one page out of ordered rows.
+
+    Returns the page and the cursor for the next one, or None when the
+    page is the last. Without a limit the rest of the rows is returned.
+    """
+    start = decode_cursor(cursor, fingerprint) if cursor else 0
+    if limit is None:
+        return rows[start:], None
+    end = start + limit
+    next_cursor = encode_cursor(end, fingerprint) if end < len(rows) else None
+    return rows[start:end], next_cursor
@@ -0,0 +1,161 @@
+"""Tokenized inverted index for product search."""
+
+import re
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional
+
+from .fuzzy import PREFIX_END, FuzzyMatcher, combine_term_costs, fuzzy_terms
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-cased word tokens."""
+    return TOKEN_RE.findall(text.casefold()) if text else []
+
+
+def matches_query(query: str, text: str) -> bool:
+    """Check text against a query with the same semantics as SearchIndex.
+
+    For filtering products one at a time, e.g. while consuming a stream.
+    """
+    tokens = tokenize(text)
+    return all(
+        any(token.startswith(term) for token in tokens) for term in set(tokenize(query))
+    )
+
+
+class SearchIndex:
+    """Inverted index over product names and descriptions.
+
+    Built when a catalog is loaded and kept up to date with add() and
+    remove(). Rows are identified by their position in the catalog.
+    """
+
+    def __init__(self, products: Iterable[dict]):
+        self.postings: dict[str, List[int]] = {}
+        self.name_tokens: List[frozenset[str]] = []
+        for row, product in enumerate(products):
+            name_tokens = frozenset(tokenize(product.get("name", "")))
+            self.name_tokens.append(name_tokens)
+            for token in self._tokens(product, name_tokens):
+                self.postings.setdefault(token, []).append(row)
+        self.vocabulary = sorted(self.postings)
+        self._fuzzy_matcher: Optional[FuzzyMatcher] = None
+
+    @staticmethod
+    def _tokens(product: dict, name_tokens: frozenset[str]) -> frozenset[str]:
+        return name_tokens.union(tokenize(product.get("description") or ""))
+
+    def add(self, row: int, product: dict) -> None:
+        """Index a product at row, which must be empty or one past the end."""
+        name_tokens = frozenset(tokenize(product.get("name", "")))
+        if row == len(self.name_tokens):
+            self.name_tokens.append(name_tokens)
+        else:
+            self.name_tokens[row] = name_tokens
+        for token in self._tokens(product, name_tokens):
+            rows = self.postings.get(token)
+            if rows is None:
+                self.postings[token] = [row]
+                insort(self.vocabulary, token)
+                self._fuzzy_matcher = None
+            else:
+                rows.append(row)
+
+    def remove(self, row: int, product: dict) -> None:
+        """Drop the postings of the product currently indexed at row.
+
+        Removing the last row shrinks the index by one.
+        """
+        for token in self._tokens(product, self.name_tokens[row]):
+            rows = self.postings[token]
+            rows.remove(row)
+            if not rows:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+                self._fuzzy_matcher = None
+        if row == len(self.name_tokens) - 1:
+            self.name_tokens.pop()
+        else:
+            self.name_tokens[row] = frozenset()
+
+    def _prefix_tokens(self, prefix: str) -> List[str]:
+        """Return all indexed tokens starting with prefix."""
+        lo = bisect_left(self.vocabulary, prefix)
+        hi = bisect_left(self.vocabulary, prefix + PREFIX_END, lo)
+        return self.vocabulary[lo:hi]
+
+    def _term_rows(self, tokens: List[str]) -> set[int]:
+        """Union the postings of the tokens a term expands to."""
+        rows: set[int] = set()
+        for token in tokens:
+            rows.update(self.postings[token])
+        return rows
+
+    def search(self, query: str) -> List[int]:
+        """Return rows matching every query term, in catalog order.
+
+        Each term matches tokens it is a prefix of, so "tulip" finds
+        "Tulips". Terms are intersected smallest-first and evaluation stops
+        as soon as the candidate set is empty.
+        """
+        expansions = [self._prefix_tokens(term) for term in set(tokenize(query))]
+        if not expansions:
+            return []
+        expansions.sort(key=lambda tokens: sum(len(self.postings[t]) for t in tokens))
+
+        result = self._term_rows(expansions[0])
+        for tokens in expansions[1:]:
+            if not result:
+                break
+            result &= self._term_rows(tokens)
+        return sorted(result)
+
+    def relevance(self, query: str, row: int) -> int:
+        """Score how well a matching row fits the query.
+
+        Exact name tokens score highest, then name prefixes; terms only
+        found in the description score lowest.
+        """
+        name_tokens = self.name_tokens[row]
+        score = 0
+        for term in set(tokenize(query)):
+            if term in name_tokens:
+                score += 3
+            elif any(token.startswith(term) for token in name_tokens):
+                score += 2
+            else:
+                score += 1
+        return score
+
+    @property
+    def fuzzy_matcher(self) -> FuzzyMatcher:
+        """Trigram index over the vocabulary, built on first fuzzy query."""
+        if self._fuzzy_matcher is None:
+            self._fuzzy_matcher = FuzzyMatcher(self.vocabulary)
+        return self._fuzzy_matcher
+
+    def fuzzy_search(self, query: str) -> List[int]:
+        """Return rows matching every query term up to a few typos.
+
+        Rows are ranked by total edit distance, then by relevance, so exact
+        matches come first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        costs = {}
+        for term in fuzzy_terms(terms):
+            rows: dict[int, int] = {}
+            for token, distance in self.fuzzy_matcher.expand(term).items():
+                for row in self.postings[token]:
+                    if distance < rows.get(row, distance + 1):
+                        rows[row] = distance
+            costs[term] = rows
+
+        matches = combine_term_costs(terms, costs)
+        return sorted(
+            matches, key=lambda row: (matches[row], -self.relevance(query, row), row)
+        )
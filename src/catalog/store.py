@@ -0,0 +1,398 @@
+"""Columnar, array-backed product catalog."""
+
+import sys
+import time
+from typing import Iterable, Iterator, List, Literal, Optional, Tuple
+
+import numpy as np
+
+from .changes import ChangeLog, ChangeOp, build_changes
+from .export import EXPORT_CHUNK_ROWS
+from .facets import PRICE_BUCKET_COUNT, PRICE_BUCKET_EDGES, build_facets, price_bucket
+from .fuzzy import SearchMode
+from .search_index import SearchIndex
+from .summary import build_summary
+
+SortOrder = Literal["price_asc", "price_desc", "relevance"]
+
+
+class CatalogChanged(RuntimeError):
+    """Raised when the catalog changes while it is being exported."""
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+class CatalogStore:
+    """Product catalog stored as columns instead of a list of dicts.
+
+    Prices live in a float64 array and categories are dictionary-encoded to
+    small integer codes, so price and category filters are vectorized masks.
+    String columns are interned. Rows are only turned back into dicts when a
+    response is built.
+
+    upsert() and delete() update the columns and indexes in place, bump the
+    version and record the change for the /products/changes feed.
+    """
+
+    def __init__(self, products: Iterable[dict]):
+        products = list(products)
+        # Bumped on every change; keys cached responses and the change feed.
+        # Starting from the load time keeps versions increasing across restarts.
+        self.version = time.time_ns() // 1_000_000
+        self.changes = ChangeLog(self.version)
+
+        self.ids: List[str] = [_intern(p["id"]) for p in products]
+        self.rows_by_id: dict[str, int] = {
+            product_id: row for row, product_id in enumerate(self.ids)
+        }
+        self.names: List[str] = [_intern(p["name"]) for p in products]
+        self.descriptions: List[Optional[str]] = [
+            _intern(p.get("description")) for p in products
+        ]
+        self.images: List[Optional[str]] = [_intern(p.get("image")) for p in products]
+        self.prices = np.array([float(p["price"]) for p in products], dtype=np.float64)
+
+        # Dictionary-encode categories: code -> name and name -> code
+        self.categories: List[Optional[str]] = []
+        self.category_codes_by_name: dict[Optional[str], int] = {}
+        codes = []
+        for p in products:
+            category = _intern(p.get("category"))
+            if category not in self.category_codes_by_name:
+                self.category_codes_by_name[category] = len(self.categories)
+                self.categories.append(category)
+            codes.append(self.category_codes_by_name[category])
+        self.category_codes = np.array(
+            codes, dtype=np.min_scalar_type(max(len(self.categories) - 1, 0))
+        )
+
+        self._price_order: Optional[np.ndarray] = None
+        self.search_index = SearchIndex(products)
+
+        # Facet indexes: each row's price bucket, and whole-catalog counts
+        self.price_buckets = np.searchsorted(
+            np.array(PRICE_BUCKET_EDGES), self.prices, side="right"
+        ).astype(np.uint8)
+        self.category_counts = np.bincount(
+            self.category_codes, minlength=len(self.categories)
+        )
+        self.bucket_counts = np.bincount(self.price_buckets, minlength=PRICE_BUCKET_COUNT)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def price_order(self) -> np.ndarray:
+        """Row ids ordered by ascending price, recomputed after changes."""
+        if self._price_order is None:
+            self._price_order = np.argsort(self.prices, kind="stable")
+        return self._price_order
+
+    def _category_code(self, category: Optional[str]) -> int:
+        code = self.category_codes_by_name.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.category_codes_by_name[category] = code
+            self.categories.append(category)
+            self.category_counts = np.append(self.category_counts, 0)
+            if code > np.iinfo(self.category_codes.dtype).max:
+                self.category_codes = self.category_codes.astype(np.min_scalar_type(code))
+        return code
+
+    def _set_row(self, row: int, product: dict) -> None:
+        """Write a product into row, or append it when row is one past the end."""
+        price = float(product["price"])
+        code = self._category_code(_intern(product.get("category")))
+        bucket = price_bucket(price)
+        values = (
+            _intern(product["id"]),
+            _intern(product["name"]),
+            _intern(product.get("description")),
+            _intern(product.get("image")),
+        )
+        columns = (self.ids, self.names, self.descriptions, self.images)
+        if row == len(self):
+            for column, value in zip(columns, values):
+                column.append(value)
+            self.prices = np.append(self.prices, price)
+            self.category_codes = np.append(
+                self.category_codes, np.array([code], dtype=self.category_codes.dtype)
+            )
+            self.price_buckets = np.append(
+                self.price_buckets, np.array([bucket], dtype=np.uint8)
+            )
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+            self.prices[row] = price
+            self.category_codes[row] = code
+            self.price_buckets[row] = bucket
+        self.category_counts[code] += 1
+        self.bucket_counts[bucket] += 1
+        self.search_index.add(row, product)
+
+    def _clear_row(self, row: int) -> None:
+        """Take a row out of the counts and the search index."""
+        self.category_counts[self.category_codes[row]] -= 1
+        self.bucket_counts[self.price_buckets[row]] -= 1
+        self.search_index.remove(row, self.row(row))
+
+    def _changed(self, op: ChangeOp, product_id: str) -> None:
+        self._price_order = None
+        self.version += 1
+        self.changes.record(self.version, op, product_id)
+
+    def upsert(self, product: dict) -> None:
+        """Add a product, or replace the product with the same ID."""
+        row = self.rows_by_id.get(product["id"])
+        if row is None:
+            row = len(self)
+            self.rows_by_id[_intern(product["id"])] = row
+        else:
+            self._clear_row(row)
+        self._set_row(row, product)
+        self._changed("upsert", product["id"])
+
+    def delete(self, product_id: str) -> bool:
+        """Remove a product; returns False if it was not in the catalog.
+
+        The last row is moved into the freed slot so the columns stay dense.
+        """
+        row = self.rows_by_id.pop(product_id, None)
+        if row is None:
+            return False
+        self._clear_row(row)
+        last = len(self) - 1
+        if row != last:
+            moved = self.row(last)
+            self._clear_row(last)
+            self._set_row(row, moved)
+            self.rows_by_id[moved["id"]] = row
+        for column in (self.ids, self.names, self.descriptions, self.images):
+            column.pop()
+        self.prices = self.prices[:last]
+        self.category_codes = self.category_codes[:last]
+        self.price_buckets = self.price_buckets[:last]
+        self._changed("delete", product_id)
+        return True
+
+    def sync(self, products: Iterable[dict]) -> Tuple[int, int]:
+        """Make the catalog hold exactly `products`, for a catalog loader.
+
+        Only products that differ are upserted and only missing ones are
+        deleted, so the change feed lists real changes. Returns the number
+        of upserts and deletes.
+        """
+        upserts = 0
+        seen = set()
+        for product in products:
+            seen.add(product["id"])
+            current = self.get(product["id"])
+            product = {
+                "id": product["id"],
+                "name": product["name"],
+                "price": float(product["price"]),
+                "description": product.get("description"),
+                "category": product.get("category"),
+                "image": product.get("image"),
+            }
+            if current != product:
+                self.upsert(product)
+                upserts += 1
+        stale = [product_id for product_id in self.ids if product_id not in seen]
+        for product_id in stale:
+            self.delete(product_id)
+        return upserts, len(stale)
+
+    def changes_since(self, since: int) -> dict:
+        """Upserts and deletes after version `since`, as served by /products/changes."""
+        changed = None if since > self.version else self.changes.since(since)
+        if changed is None:
+            return build_changes(self.version, since, resync=True)
+        upserts = [product_id for product_id, op in changed.items() if op == "upsert"]
+        deletes = [product_id for product_id, op in changed.items() if op == "delete"]
+        return build_changes(self.version, since, self.get_many(upserts)[0], deletes)
+
+    def summary(self) -> dict:
+        """Categories, price range and term filter, as served by /products/summary."""
+        present = [category for category, count in zip(self.categories, self.category_counts) if count]
+        prices = self.prices[self.price_order[[0, -1]]] if len(self) else (None, None)
+        return build_summary(
+            self.version, len(self), present, prices[0], prices[1], self.search_index.vocabulary
+        )
+
+    def row(self, row: int) -> dict:
+        """Materialize a single row as a product dict."""
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "price": float(self.prices[row]),
+            "description": self.descriptions[row],
+            "category": self.categories[self.category_codes[row]],
+            "image": self.images[row],
+        }
+
+    def rows(self, rows: Optional[Iterable[int]] = None) -> List[dict]:
+        """Materialize rows (all rows by default) as product dicts."""
+        if rows is None:
+            rows = range(len(self))
+        return [self.row(int(row)) for row in rows]
+
+    def get(self, product_id: str) -> Optional[dict]:
+        """Look up a product by ID, or None if it is not in the catalog."""
+        row = self.rows_by_id.get(product_id)
+        return None if row is None else self.row(row)
+
+    def get_many(self, product_ids: Iterable[str]) -> Tuple[List[dict], List[str]]:
+        """Look up several products by ID.
+
+        Returns the products found, in request order without duplicates,
+        and the IDs that were not found.
+        """
+        products, missing = [], []
+        for product_id in dict.fromkeys(product_ids):
+            row = self.rows_by_id.get(product_id)
+            if row is None:
+                missing.append(product_id)
+            else:
+                products.append(self.row(row))
+        return products, missing
+
+    def iter_rows(
+        self, version: Optional[int] = None, chunk_rows: int = EXPORT_CHUNK_ROWS
+    ) -> Iterator[dict]:
+        """Yield every row as a product dict, one at a time.
+
+        Columns are copied chunk_rows rows at a time, so memory does not
+        grow with the catalog. A change between chunks could move rows past
+        the export (deletes fill the gap with the last row), so if the
+        catalog is no longer at `version` (by default, its version when
+        iteration starts) CatalogChanged is raised rather than send a torn
+        catalog.
+        """
+        if version is None:
+            version = self.version
+        for start in range(0, len(self), chunk_rows):
+            if self.version != version:
+                raise CatalogChanged(f"Catalog changed during export (version {version})")
+            stop = start + chunk_rows
+            columns = zip(
+                self.ids[start:stop],
+                self.names[start:stop],
+                self.prices[start:stop].tolist(),
+                self.descriptions[start:stop],
+                [self.categories[code] for code in self.category_codes[start:stop]],
+                self.images[start:stop],
+            )
+            for product_id, name, price, description, category, image in columns:
+                yield {
+                    "id": product_id,
+                    "name": name,
+                    "price": price,
+                    "description": description,
+                    "category": category,
+                    "image": image,
+                }
+
+    def filter(
+        self,
+        q: str = "",
+        max_price: float = None,
+        category: str = None,
+        fuzzy: bool = False,
+    ) -> np.ndarray:
+        """Return matching row ids.
+
+        Text matching goes through the inverted index; price and category
+        are applied as array masks over the candidates. Rows are in catalog
+        order, or ranked by closeness for fuzzy matching.
+        """
+        if category:
+            code = self.category_codes_by_name.get(category)
+            if code is None:
+                return np.empty(0, dtype=np.intp)
+
+        if q:
+            matches = self.search_index.fuzzy_search(q) if fuzzy else self.search_index.search(q)
+            rows = np.array(matches, dtype=np.intp)
+            if max_price:
+                rows = rows[self.prices[rows] <= max_price]
+            if category:
+                rows = rows[self.category_codes[rows] == code]
+            return rows
+
+        mask = np.ones(len(self), dtype=bool)
+        if max_price:
+            mask &= self.prices <= max_price
+        if category:
+            mask &= self.category_codes == code
+        return np.flatnonzero(mask)
+
+    def sort(self, rows: np.ndarray, sort: Optional[SortOrder], q: str = "") -> np.ndarray:
+        """Order filtered rows; without a sort order rows keep catalog order."""
+        if sort in ("price_asc", "price_desc"):
+            if len(rows) == len(self):
+                ordered = self.price_order
+            elif len(rows) * 8 < len(self):
+                ordered = rows[np.argsort(self.prices[rows], kind="stable")]
+            else:
+                # Large selections reuse the precomputed order instead of sorting
+                mask = np.zeros(len(self), dtype=bool)
+                mask[rows] = True
+                ordered = self.price_order[mask[self.price_order]]
+            return ordered[::-1] if sort == "price_desc" else ordered
+        if sort == "relevance" and q:
+            scores = np.array(
+                [self.search_index.relevance(q, int(row)) for row in rows], dtype=np.int32
+            )
+            return rows[np.argsort(-scores, kind="stable")]
+        return rows
+
+    def query(
+        self,
+        q: str = "",
+        max_price: float = None,
+        category: str = None,
+        sort: Optional[SortOrder] = None,
+        mode: SearchMode = "exact",
+    ) -> np.ndarray:
+        """Filter and order rows for a search request.
+
+        "fuzzy" mode tolerates typos; "auto" only falls back to it when the
+        exact search finds nothing.
+        """
+        if mode == "exact" or not q:
+            return self.sort(self.filter(q, max_price, category), sort, q)
+        if mode == "auto":
+            rows = self.filter(q, max_price, category)
+            if len(rows):
+                return self.sort(rows, sort, q)
+        rows = self.filter(q, max_price, category, fuzzy=True)
+        # Fuzzy rows are already ranked by edit distance and relevance
+        return rows if sort in (None, "relevance") else self.sort(rows, sort)
+
+    def facets(self, rows: np.ndarray) -> dict:
+        """Category counts, price histogram and price range of a result set.
+
+        The whole catalog is answered from the maintained counts; other
+        result sets are counted from the per-row facet codes.
+        """
+        if len(rows) == 0:
+            return build_facets({}, [0] * PRICE_BUCKET_COUNT, None, None)
+        if len(rows) == len(self):
+            category_counts = self.category_counts
+            bucket_counts = self.bucket_counts
+            min_price = self.prices[self.price_order[0]]
+            max_price = self.prices[self.price_order[-1]]
+        else:
+            category_counts = np.bincount(
+                self.category_codes[rows], minlength=len(self.categories)
+            )
+            bucket_counts = np.bincount(self.price_buckets[rows], minlength=PRICE_BUCKET_COUNT)
+            prices = self.prices[rows]
+            min_price, max_price = prices.min(), prices.max()
+        return build_facets(
+            dict(zip(self.categories, category_counts)), bucket_counts, min_price, max_price
+        )
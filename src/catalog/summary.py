@@ -0,0 +1,129 @@
+"""Compact catalog summaries that let a federation skip shops that cannot match."""
+
+import base64
+import hashlib
+import math
+import unicodedata
+from typing import Iterable, List, Optional
+
+from .search_index import tokenize
+
+# Query terms match indexed tokens by prefix, so every prefix of at least
+# this many characters is added to the term filter; shorter terms are not
+# checked
+MIN_PREFIX = 3
+# Target false positive rate of the term filter
+BLOOM_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """Bit array set membership with false positives but no false negatives."""
+
+    def __init__(self, size: int, hashes: int, bits: Optional[bytes] = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, items: int, error_rate: float = BLOOM_ERROR_RATE) -> "BloomFilter":
+        items = max(items, 1)
+        size = max(64, math.ceil(-items * math.log(error_rate) / math.log(2) ** 2))
+        return cls(size, max(1, round(size / items * math.log(2))))
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def to_dict(self) -> dict:
+        return {
+            "size": self.size,
+            "hashes": self.hashes,
+            "bits": base64.b64encode(bytes(self.bits)).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        return cls(data["size"], data["hashes"], base64.b64decode(data["bits"]))
+
+
+def _fold(term: str) -> str:
+    """Strip diacritics, as SQLite's unicode61 tokenizer does when indexing."""
+    decomposed = unicodedata.normalize("NFKD", term)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _prefixes(token: str) -> Iterable[str]:
+    if len(token) <= MIN_PREFIX:
+        return (token,)
+    return (token[:end] for end in range(MIN_PREFIX, len(token) + 1))
+
+
+def build_summary(
+    version: int,
+    count: int,
+    categories: Iterable[Optional[str]],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    vocabulary: Iterable[str],
+) -> dict:
+    """Response body of /products/summary."""
+    prefixes = {prefix for token in vocabulary for prefix in _prefixes(token)}
+    terms = BloomFilter.for_capacity(len(prefixes))
+    for prefix in prefixes:
+        terms.add(prefix)
+    return {
+        "version": version,
+        "count": count,
+        "categories": sorted(category for category in categories if category),
+        "price": None if min_price is None else {"min": float(min_price), "max": float(max_price)},
+        "terms": terms.to_dict(),
+        "min_prefix": MIN_PREFIX,
+    }
+
+
+class CatalogSummary:
+    """A shop's published summary, answering "could this search match?".
+
+    Answers are conservative: False only when the shop certainly has no
+    exact match.
+    """
+
+    def __init__(self, data: dict):
+        self.version = data.get("version")
+        self.count = data.get("count")
+        self.categories = set(data.get("categories", []))
+        price = data.get("price")
+        self.min_price: Optional[float] = price["min"] if price else None
+        self.terms = BloomFilter.from_dict(data["terms"])
+        self.min_prefix = data.get("min_prefix", MIN_PREFIX)
+
+    def may_match_filters(self, max_price: Optional[float] = None, category: Optional[str] = None) -> bool:
+        """Whether any product could pass the price and category filters."""
+        if self.count == 0:
+            return False
+        if category and category not in self.categories:
+            return False
+        if max_price and self.min_price is not None and self.min_price > max_price:
+            return False
+        return True
+
+    def may_match_terms(self, terms: List[str]) -> bool:
+        """Whether every (tokenized) query term may prefix an indexed token."""
+        return all(
+            len(term) < self.min_prefix or term in self.terms or _fold(term) in self.terms
+            for term in terms
+        )
+
+
+def query_terms(query: str) -> List[str]:
+    """Tokenize a query the way summaries are checked against it."""
+    return list(dict.fromkeys(tokenize(query or "")))
@@ -7,10 +7,15 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from src.agent.registry import shop_registry
+from src.agent.replica import FEDERATION_REPLICA, federation_replica
+from src.agent.transport import shop_transport
+
 from .models import init_db
 from .capabilities import discovery_router, checkout_router
 from .capabilities.chat import router as chat_router
-from .capabilities.products import router as products_router
+from .capabilities.federation import router as federation_router
+from .capabilities.products import router as products_router, seed_products
 
 # Configure logging
 logging.basicConfig(
@@ -26,10 +31,18 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Initializing database...")
     await init_db()
+    await seed_products()
     logger.info("Database initialized")
+    shop_registry.start()
+    if FEDERATION_REPLICA:
+        logger.info("Starting federation replica sync...")
+        federation_replica.start(shop_registry)
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await federation_replica.stop()
+    await shop_registry.stop()
+    await shop_transport.aclose()
 
 
 app = FastAPI(
@@ -46,12 +59,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Catalog-Version", "X-Session-ID"],
 )
 
 # Include routers
 app.include_router(discovery_router)
 app.include_router(checkout_router)
 app.include_router(chat_router)
+app.include_router(federation_router)
 app.include_router(products_router)
 
 
@@ -1,28 +1,115 @@
 """Chat API router for Gemini agent integration."""
 
-from fastapi import APIRouter
+import asyncio
+import re
+import secrets
+import traceback
+
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+from google import genai
 from pydantic import BaseModel
-from typing import Optional
+from typing import AsyncIterator, Optional, Tuple
 
 # Use the Federation Agent to search across all shops
 from src.agent.federation_agent import FederationAgent
+from src.agent.history import HistoryManager
+from src.agent.llm_limiter import LLMOverloaded, llm_limiter
+from src.agent.search_cache import search_cache
+from src.agent.sessions import CHAT_SESSION_TTL, SessionManager
+
+from ..sse import sse_response
 
 router = APIRouter()
 
-# Global agent instance
-_agent: Optional[FederationAgent] = None
+# Seconds a whole turn, tool calls included, may take
+CHAT_TIMEOUT = 30.0
+TIMEOUT_MESSAGE = "I'm sorry, the search is taking too long. Please try again."
+ERROR_MESSAGE = "I'm sorry, I'm having trouble connecting to the shops right now. Please try again."
+BUSY_MESSAGE = "I'm sorry, I'm helping a lot of shoppers right now. Please try again in a moment."
+
+# Shoppers are told apart by this header, or else this cookie
+SESSION_HEADER = "X-Session-ID"
+SESSION_COOKIE = "ucp_session"
+SESSION_ID_RE = re.compile(r"[\w-]{16,64}")
+
+# One Gemini client for every session's agent
+_client: Optional[genai.Client] = None
+
+
+def new_agent() -> FederationAgent:
+    """Create an agent for a new session."""
+    global _client
+    try:
+        agent = FederationAgent(client=_client)
+    except ValueError as e:
+        print(f"Error initializing agent: {e}")
+        raise
+    _client = agent.client
+    return agent
+
+
+sessions = SessionManager(new_agent)
+
+
+def session_id(request: Request) -> str:
+    """The caller's session ID, or a new one if they have none."""
+    value = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not value or not SESSION_ID_RE.fullmatch(value):
+        value = secrets.token_urlsafe(24)
+    return value
+
+
+def remember_session(response: Response, value: str) -> None:
+    """Send the session ID back, as a header and a cookie renewed on every use."""
+    response.set_cookie(
+        SESSION_COOKIE, value, max_age=int(CHAT_SESSION_TTL), httponly=True, samesite="lax"
+    )
+    response.headers[SESSION_HEADER] = value
+
+
+async def _chat_events(session: str, message: str) -> AsyncIterator[Tuple[str, dict]]:
+    """One chat turn as events; always ends with a "done" event.
+
+    Each session's turns run one at a time; other sessions run
+    concurrently. Errors and timeouts end the turn with an apology.
+    """
+    print(f"DEBUG: Received chat request: {message}", flush=True)
 
+    if message.lower() == "ping":
+        yield "done", {"response": "pong 🏓"}
+        return
 
-def get_agent() -> FederationAgent:
-    """Get or create the agent instance."""
-    global _agent
-    if _agent is None:
+    try:
+        chat_session = sessions.get(session)
+    except ValueError:
+        yield "done", {"response": ERROR_MESSAGE}
+        return
+    print("DEBUG: Agent retrieved", flush=True)
+
+    async with chat_session.lock:
+        events = chat_session.agent.chat_stream(message)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CHAT_TIMEOUT
         try:
-            _agent = FederationAgent()
-        except ValueError as e:
-            print(f"Error initializing agent: {e}")
-            raise
-    return _agent
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                yield event
+        except asyncio.TimeoutError:
+            print("ERROR: Chat timed out", flush=True)
+            yield "done", {"response": TIMEOUT_MESSAGE}
+        except LLMOverloaded:
+            print("ERROR: Model call queue full", flush=True)
+            yield "done", {"response": BUSY_MESSAGE}
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Chat error: {e}", flush=True)
+            yield "done", {"response": ERROR_MESSAGE}
+        finally:
+            await events.aclose()
 
 
 class ChatRequest(BaseModel):
@@ -36,37 +123,70 @@ class ChatResponse(BaseModel):
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
-    """Send a message to the shopping agent."""
-    try:
-        print(f"DEBUG: Received chat request: {request.message}", flush=True)
-        
-        if request.message.lower() == "ping":
-             return ChatResponse(response="pong 🏓")
-
-        agent = get_agent()
-        print("DEBUG: Agent retrieved", flush=True)
-        
-        # Add 30s timeout
-        import asyncio
-        response = await asyncio.wait_for(agent.chat(request.message), timeout=30.0)
-        
-        print(f"DEBUG: Agent response length: {len(response)}", flush=True)
-        return ChatResponse(response=response)
-    except asyncio.TimeoutError:
-        print("ERROR: Chat timed out", flush=True)
-        return ChatResponse(response="I'm sorry, the search is taking too long. Please try again.")
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Chat error: {e}", flush=True)
-        return ChatResponse(response=f"I'm sorry, I'm having trouble connecting to the shops right now. Please try again.")
+async def chat(request: ChatRequest, http_request: Request, http_response: Response) -> ChatResponse:
+    """Send a message to the shopping agent and wait for the whole answer.
+
+    Each session (see session_id) has its own conversation.
+    """
+    session = session_id(http_request)
+    remember_session(http_response, session)
+    async for event, data in _chat_events(session, request.message):
+        if event == "done":
+            response = data["response"]
+    print(f"DEBUG: Agent response length: {len(response)}", flush=True)
+    return ChatResponse(response=response)
+
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request) -> StreamingResponse:
+    """Send a message to the shopping agent and stream the answer as SSE.
+
+    Emits "tool" events with a progress message while the agent searches,
+    "text" events with each piece of the answer as it is generated, a
+    "cards" event with the answer's product cards, if any, and a final
+    "done" event with the whole answer.
+    """
+    session = session_id(http_request)
+    response = sse_response(_chat_events(session, request.message))
+    remember_session(response, session)
+    return response
 
 
 @router.post("/chat/reset")
-async def reset_chat():
-    """Reset the conversation."""
-    global _agent
-    if _agent:
-        _agent.reset()
+async def reset_chat(request: Request, response: Response):
+    """Reset the caller's conversation."""
+    session = session_id(request)
+    remember_session(response, session)
+    sessions.reset(session)
     return {"status": "ok", "message": "Conversation reset"}
+
+
+@router.get("/chat/context")
+async def context_stats(request: Request, response: Response):
+    """Size of the caller's history and the context saved by compacting it.
+
+    Callers without a conversation get the stats of an empty one.
+    """
+    session = session_id(request)
+    remember_session(response, session)
+    chat_session = sessions.find(session)
+    history = chat_session.agent.history if chat_session else HistoryManager()
+    return history.stats()
+
+
+@router.get("/chat/sessions")
+async def session_stats():
+    """Counts of live, active and evicted chat sessions."""
+    return sessions.stats()
+
+
+@router.get("/chat/llm")
+async def llm_stats():
+    """In-flight, queued and rejected model calls."""
+    return llm_limiter.stats()
+
+
+@router.get("/chat/search-cache")
+async def search_cache_stats():
+    """Hit/miss counters of the federated search cache."""
+    return search_cache.stats()
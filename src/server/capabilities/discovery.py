@@ -1,10 +1,15 @@
 """UCP Discovery capability - manifest endpoint."""
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Request, Response
+
+from ..http_cache import DISCOVERY_CACHE_CONTROL, ResponseCache
 
 router = APIRouter()
 
+# The manifest is static, so it is encoded once and served from this cache
+_MANIFEST_VERSION = 1
+_manifest_cache = ResponseCache(max_entries=1)
+
 # UCP Discovery Profile
 UCP_MANIFEST = {
     "ucp": {
@@ -61,6 +66,12 @@ UCP_MANIFEST = {
 
 
 @router.get("/.well-known/ucp")
-async def get_discovery() -> JSONResponse:
+async def get_discovery(request: Request) -> Response:
     """Return UCP discovery manifest."""
-    return JSONResponse(content=UCP_MANIFEST)
+    return _manifest_cache.respond(
+        request,
+        "manifest",
+        _MANIFEST_VERSION,
+        lambda: UCP_MANIFEST,
+        cache_control=DISCOVERY_CACHE_CONTROL,
+    )
@@ -0,0 +1,30 @@
+"""Federated search API router streaming results from every shop."""
+
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from src.agent.federated_search import TOP_K, federated_search
+from src.catalog import MAX_PAGE_SIZE
+
+from ..sse import sse_response
+
+router = APIRouter()
+
+
+@router.get("/federated/search/stream")
+async def stream_federated_search(
+    q: str = "",
+    max_price: Optional[float] = None,
+    category: Optional[str] = None,
+    limit: int = Query(TOP_K, ge=1, le=MAX_PAGE_SIZE),
+) -> StreamingResponse:
+    """Search all shops, streaming each shop's results as soon as it answers.
+
+    Emits a "shop" event per answering shop, a "pruned" event per shop
+    whose catalog summary rules out a match, an "excluded" event per shop
+    that was skipped or timed out, and a final "results" event with the
+    merged, price-ranked answer.
+    """
+    return sse_response(federated_search.stream(q, max_price, category, limit))
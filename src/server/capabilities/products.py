@@ -1,10 +1,53 @@
-"""Products API router."""
+"""Products API router backed by the products table."""
 
-from fastapi import APIRouter
-from typing import List
+import json
+from decimal import Decimal
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    Float,
+    Integer,
+    Select,
+    Subquery,
+    case,
+    func,
+    literal_column,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.catalog import (
+    EXPORT_CHUNK_ROWS,
+    MAX_BATCH_IDS,
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    PRICE_BUCKET_EDGES,
+    BatchSearchRequest,
+    FacetAccumulator,
+    FuzzyMatcher,
+    InvalidCursor,
+    SearchMode,
+    SortOrder,
+    aiter_ndjson,
+    build_changes,
+    build_summary,
+    combine_term_costs,
+    decode_cursor,
+    encode_cursor,
+    fuzzy_terms,
+    query_fingerprint,
+    tokenize,
+)
+
+from ..http_cache import ResponseCache
+from ..models import Product, async_session_maker, get_db
 
 router = APIRouter()
 
+# Demo catalog loaded into an empty products table at startup
 PRODUCTS = [
     {"id": "prod_001", "name": "Red Roses Bouquet", "price": 49.99, "description": "Beautiful bouquet of 12 fresh red roses", "category": "flowers", "image": "https://images.unsplash.com/photo-1518882605630-8eb-cd7d?w=400"},
     {"id": "prod_002", "name": "White Lilies", "price": 39.99, "description": "Elegant white lilies arrangement", "category": "flowers", "image": "https://images.unsplash.com/photo-1533616688419-b7a585564566?w=400"},
@@ -25,29 +68,403 @@ PRODUCTS = [
     {"id": "prod_023", "name": "Get Well Soon", "price": 44.99, "description": "Cheerful recovery flowers", "category": "arrangements", "image": "https://images.unsplash.com/photo-1518882605630-8eb-cd7d?w=400"},
 ]
 
+# Stock given to each seeded product
+SEED_INVENTORY = 100
 
-@router.get("/products")
-async def get_products() -> List[dict]:
-    """Get all products."""
-    return PRODUCTS
+RESPONSE_CACHE = ResponseCache()
 
+PRODUCT_ROWID = literal_column("products.rowid")
 
-@router.get("/products/search")
-async def search_products(q: str = "", max_price: float = None, category: str = None) -> dict:
-    """Search products."""
-    results = PRODUCTS
-    if q:
-        results = [p for p in results if q.lower() in p["name"].lower() or q.lower() in p["description"].lower()]
+# Trigram matcher over the FTS vocabulary, keyed by search_meta version
+_fuzzy_matcher: Optional[Tuple[int, FuzzyMatcher]] = None
+
+
+async def seed_products() -> None:
+    """Load the demo catalog into the products table if it is empty."""
+    async with async_session_maker() as db:
+        if await db.scalar(select(func.count()).select_from(Product)):
+            return
+        db.add_all(
+            Product(
+                id=p["id"],
+                name=p["name"],
+                description=p["description"],
+                price=Decimal(str(p["price"])),
+                inventory=SEED_INVENTORY,
+                image_url=p["image"],
+                category=p["category"],
+            )
+            for p in PRODUCTS
+        )
+        await db.commit()
+
+
+async def _catalog_version(db: AsyncSession) -> int:
+    """Current catalog version: the sequence number of the latest change."""
+    result = await db.execute(text("SELECT MAX(seq) FROM product_changes"))
+    return result.scalar_one() or 0
+
+
+def _match_expression(q: str) -> str:
+    """Build an FTS5 query that ANDs every term as a prefix match."""
+    return " AND ".join(f'"{term}"*' for term in dict.fromkeys(tokenize(q)))
+
+
+def _fts_matches(q: str) -> Subquery:
+    """Rowids matching q in the FTS index, ranked by bm25 (lower is better)."""
+    # Name matches weigh more than description matches
+    return (
+        text(
+            "SELECT rowid, bm25(products_fts, 3.0, 1.0) AS rank "
+            "FROM products_fts WHERE products_fts MATCH :match"
+        )
+        .bindparams(match=_match_expression(q))
+        .columns(rowid=Integer, rank=Float)
+        .subquery("matches")
+    )
+
+
+def _ranked_matches(costs: Dict[int, int]) -> Subquery:
+    """Rowids from a precomputed rowid -> rank mapping, as a subquery."""
+    return (
+        text(
+            "SELECT json_extract(value, '$[0]') AS rowid, "
+            "json_extract(value, '$[1]') AS rank FROM json_each(:matches)"
+        )
+        .bindparams(matches=json.dumps(list(costs.items())))
+        .columns(rowid=Integer, rank=Float)
+        .subquery("matches")
+    )
+
+
+async def _get_fuzzy_matcher(db: AsyncSession) -> FuzzyMatcher:
+    """Trigram matcher over the indexed vocabulary, rebuilt when text changes."""
+    global _fuzzy_matcher
+    result = await db.execute(text("SELECT version FROM search_meta WHERE id = 1"))
+    version = result.scalar_one()
+    if _fuzzy_matcher is None or _fuzzy_matcher[0] != version:
+        terms = await db.scalars(text("SELECT term FROM products_fts_vocab"))
+        _fuzzy_matcher = (version, FuzzyMatcher(terms))
+    return _fuzzy_matcher[1]
+
+
+async def _fuzzy_costs(db: AsyncSession, q: str) -> Dict[int, int]:
+    """Rowids matching q up to a few typos, mapped to their edit distance."""
+    matcher = await _get_fuzzy_matcher(db)
+    terms = list(dict.fromkeys(tokenize(q)))
+    costs = {}
+    for term in fuzzy_terms(terms):
+        tokens_by_distance: Dict[int, list] = {}
+        for token, distance in matcher.expand(term).items():
+            tokens_by_distance.setdefault(distance, []).append(token)
+
+        rows: Dict[int, int] = {}
+        for distance in sorted(tokens_by_distance):
+            # Distance 0 is exactly the set of tokens the term prefixes
+            if distance == 0:
+                match = f'"{term}"*'
+            else:
+                match = " OR ".join(f'"{token}"' for token in tokens_by_distance[distance])
+            result = await db.execute(
+                text("SELECT rowid FROM products_fts WHERE products_fts MATCH :match"),
+                {"match": match},
+            )
+            for (rowid,) in result:
+                rows.setdefault(rowid, distance)
+        costs[term] = rows
+    return combine_term_costs(terms, costs)
+
+
+def _search_statement(
+    matches: Optional[Subquery],
+    max_price: Optional[float],
+    category: Optional[str],
+    sort: Optional[SortOrder],
+) -> Select:
+    """Build the filtered, ordered product query for a search.
+
+    matches restricts the query to text matches and supplies their rank.
+    """
+    stmt = select(Product)
+    rank = None
+    if matches is not None:
+        stmt = stmt.join(matches, matches.c.rowid == PRODUCT_ROWID)
+        rank = matches.c.rank
     if max_price:
-        results = [p for p in results if p["price"] <= max_price]
+        stmt = stmt.where(Product.price <= max_price)
     if category:
-        results = [p for p in results if p["category"] == category]
-    return {"shop": "UCP Flower Shop", "products": results}
+        stmt = stmt.where(Product.category == category)
+
+    if sort == "price_asc":
+        return stmt.order_by(Product.price, PRODUCT_ROWID)
+    if sort == "price_desc":
+        return stmt.order_by(Product.price.desc(), PRODUCT_ROWID)
+    if sort == "relevance" and rank is not None:
+        return stmt.order_by(rank, PRODUCT_ROWID)
+    return stmt.order_by(PRODUCT_ROWID)
+
+
+def _count(stmt: Select) -> Select:
+    """Count the rows a product query matches."""
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
+
+
+async def _facets(db: AsyncSession, stmt: Select) -> dict:
+    """Aggregate facets for a search in one grouped query.
+
+    Groups by category and price bucket over the indexed search query, so
+    only matching rows are visited.
+    """
+    matches = stmt.order_by(None).subquery()
+    bucket = case(
+        *((matches.c.price < edge, i) for i, edge in enumerate(PRICE_BUCKET_EDGES)),
+        else_=len(PRICE_BUCKET_EDGES),
+    )
+    result = await db.execute(
+        select(
+            matches.c.category,
+            bucket,
+            func.count(),
+            func.min(matches.c.price),
+            func.max(matches.c.price),
+        ).group_by(matches.c.category, bucket)
+    )
+    facets = FacetAccumulator()
+    for category, bucket_index, count, min_price, max_price in result:
+        facets.add_group(category, bucket_index, count, float(min_price), float(max_price))
+    return facets.to_dict()
+
+
+async def _fetch_page(
+    db: AsyncSession,
+    stmt: Select,
+    limit: Optional[int],
+    cursor: Optional[str],
+    fingerprint: str,
+) -> tuple[list[dict], Optional[str]]:
+    """Fetch one page of a product query and the cursor for the next."""
+    try:
+        start = decode_cursor(cursor, fingerprint) if cursor else 0
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stmt = stmt.offset(start)
+    if limit is None:
+        products = (await db.scalars(stmt)).all()
+        return [p.to_catalog_item() for p in products], None
+
+    # One extra row tells whether another page exists
+    products = (await db.scalars(stmt.limit(limit + 1))).all()
+    next_cursor = encode_cursor(start + limit, fingerprint) if len(products) > limit else None
+    return [p.to_catalog_item() for p in products[:limit]], next_cursor
+
+
+@router.get("/products")
+async def get_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[SortOrder] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    """Get all products, or one page of them when a limit is given."""
+    async def build():
+        stmt = _search_statement(None, None, None, sort)
+        products, next_cursor = await _fetch_page(
+            db, stmt, limit, cursor, query_fingerprint(sort)
+        )
+        return products, {"X-Next-Cursor": next_cursor} if next_cursor else None
+
+    return await RESPONSE_CACHE.respond_async(
+        request, ("products", limit, sort, cursor), await _catalog_version(db), build
+    )
+
+
+async def _search(
+    db: AsyncSession,
+    q: str,
+    max_price: Optional[float],
+    category: Optional[str],
+    limit: Optional[int],
+    sort: Optional[SortOrder],
+    cursor: Optional[str],
+    facets: bool,
+    mode: SearchMode,
+) -> dict:
+    """Run one search: a page of products, the total and optional facets."""
+    if q and not tokenize(q):
+        result = {"products": [], "total": 0, "next_cursor": None}
+        if facets:
+            result["facets"] = FacetAccumulator().to_dict()
+        return result
+
+    stmt = _search_statement(_fts_matches(q) if q else None, max_price, category, sort)
+    if q and mode != "exact":
+        if mode == "fuzzy" or not await db.scalar(_count(stmt)):
+            # Fuzzy matches are ranked by edit distance unless sorted by price
+            costs = await _fuzzy_costs(db, q)
+            stmt = _search_statement(
+                _ranked_matches(costs), max_price, category, sort or "relevance"
+            )
+    facet_counts = await _facets(db, stmt) if facets else None
+    if facet_counts is not None:
+        total = sum(bucket["count"] for bucket in facet_counts["price_buckets"])
+    else:
+        total = await db.scalar(_count(stmt))
+    products, next_cursor = await _fetch_page(
+        db, stmt, limit, cursor, query_fingerprint(q, max_price, category, sort, mode)
+    )
+    result = {"products": products, "total": total, "next_cursor": next_cursor}
+    if facet_counts is not None:
+        result["facets"] = facet_counts
+    return result
+
+
+@router.get("/products/search")
+async def search_products(
+    q: str = "",
+    max_price: float = None,
+    category: str = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[SortOrder] = None,
+    cursor: Optional[str] = None,
+    facets: bool = False,
+    mode: SearchMode = "exact",
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    """Search products, optionally with facet counts for all matches.
+
+    mode="fuzzy" tolerates typos; mode="auto" only falls back to fuzzy
+    matching when the exact search finds nothing.
+    """
+    result = await _search(db, q, max_price, category, limit, sort, cursor, facets, mode)
+    return {"shop": "UCP Flower Shop", **result}
+
+
+@router.post("/products/search/batch")
+async def search_products_batch(
+    batch: BatchSearchRequest, db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Run several searches in one request, returning results in query order.
+
+    Each result is the first page of the equivalent /products/search.
+    """
+    results = [
+        await _search(
+            db, query.q, query.max_price, query.category,
+            batch.limit, batch.sort, None, batch.facets, batch.mode,
+        )
+        for query in batch.queries
+    ]
+    return {"shop": "UCP Flower Shop", "results": results}
+
+
+async def _iter_catalog() -> AsyncIterator[dict]:
+    """Stream every product from the database in catalog order."""
+    async with async_session_maker() as db:
+        stmt = select(Product).order_by(PRODUCT_ROWID).execution_options(
+            yield_per=EXPORT_CHUNK_ROWS
+        )
+        async for product in await db.stream_scalars(stmt):
+            yield product.to_catalog_item()
+
+
+@router.get("/products/export")
+async def export_products(db: AsyncSession = Depends(get_db)) -> StreamingResponse:
+    """Stream the full catalog as NDJSON, one product per line.
+
+    X-Catalog-Version is read before the export starts, so following
+    /products/changes from it may replay a few changes but never misses one.
+    """
+    version = await _catalog_version(db)
+    return StreamingResponse(
+        aiter_ndjson(_iter_catalog()),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Catalog-Version": str(version)},
+    )
+
+
+@router.get("/products/changes")
+async def get_product_changes(
+    since: int = Query(..., ge=0), db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Products upserted or deleted after catalog version `since`.
+
+    Asks for a full resync when the change log no longer reaches back to
+    `since`.
+    """
+    result = await db.execute(text("SELECT MIN(seq), MAX(seq) FROM product_changes"))
+    first, version = result.one()
+    version = version or 0
+    if since > version or (first is not None and since < first - 1):
+        return build_changes(version, since, resync=True)
+
+    result = await db.execute(
+        text(
+            "SELECT product_id, op FROM product_changes WHERE seq IN ("
+            "SELECT MAX(seq) FROM product_changes WHERE seq > :since GROUP BY product_id"
+            ") ORDER BY seq"
+        ),
+        {"since": since},
+    )
+    changed = dict(result.all())
+    upserted = [product_id for product_id, op in changed.items() if op == "upsert"]
+    found = {
+        product.id: product
+        for product in await db.scalars(select(Product).where(Product.id.in_(upserted)))
+    }
+    return build_changes(
+        version,
+        since,
+        [found[product_id].to_catalog_item() for product_id in upserted if product_id in found],
+        [product_id for product_id in changed if product_id not in found],
+    )
+
+
+@router.get("/products/summary")
+async def get_product_summary(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
+    """Categories, price range and term filter, for federations routing searches."""
+    version = await _catalog_version(db)
+
+    async def build():
+        result = await db.execute(
+            select(func.count(), func.min(Product.price), func.max(Product.price))
+        )
+        count, min_price, max_price = result.one()
+        categories = await db.scalars(select(Product.category).distinct())
+        terms = await db.scalars(text("SELECT term FROM products_fts_vocab"))
+        return build_summary(version, count, categories, min_price, max_price, terms), None
+
+    return await RESPONSE_CACHE.respond_async(request, "summary", version, build)
+
+
+@router.get("/products/batch")
+async def get_products_batch(ids: str, db: AsyncSession = Depends(get_db)) -> dict:
+    """Get several products by comma-separated IDs in one request."""
+    product_ids = list(dict.fromkeys(product_id for product_id in ids.split(",") if product_id))
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_IDS} IDs per batch"
+        )
+    result = await db.scalars(select(Product).where(Product.id.in_(product_ids)))
+    found = {product.id: product for product in result}
+    return {
+        "products": [found[i].to_catalog_item() for i in product_ids if i in found],
+        "missing": [i for i in product_ids if i not in found],
+    }
+
 
 @router.get("/products/{product_id}")
-async def get_product(product_id: str) -> dict:
+async def get_product(
+    request: Request, product_id: str, db: AsyncSession = Depends(get_db)
+) -> Response:
     """Get a single product by ID."""
-    for product in PRODUCTS:
-        if product["id"] == product_id:
-            return product
-    return {"error": "Product not found"}
+    async def build():
+        product = await db.get(Product, product_id)
+        if product is None:
+            return {"error": "Product not found"}, None
+        return product.to_catalog_item(), None
+
+    return await RESPONSE_CACHE.respond_async(
+        request, ("product", product_id), await _catalog_version(db), build
+    )
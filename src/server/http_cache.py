@@ -0,0 +1,118 @@
+"""Pre-serialized response cache with ETag validation."""
+
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+# Clients may store catalog responses but must revalidate before reuse
+CATALOG_CACHE_CONTROL = "public, no-cache"
+DISCOVERY_CACHE_CONTROL = "public, max-age=300"
+
+
+@dataclass
+class CachedBody:
+    """An encoded response body and its validator."""
+    version: int
+    body: bytes
+    etag: str
+    headers: Optional[dict] = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+class ResponseCache:
+    """LRU cache of JSON responses encoded once per catalog version.
+
+    Entries are keyed by route and parameters. A hit whose version is
+    older than the catalog is rebuilt, so callers never see stale data.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, CachedBody] = OrderedDict()
+
+    def _lookup(self, key: Hashable, version: int) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(
+        self, key: Hashable, version: int, payload: Any, headers: Optional[dict] = None
+    ) -> CachedBody:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        entry = CachedBody(version=version, body=body, etag=etag, headers=headers)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _to_response(
+        request: Request,
+        entry: CachedBody,
+        cache_control: str,
+        headers: Optional[dict] = None,
+    ) -> Response:
+        response_headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+        if entry.headers:
+            response_headers.update(entry.headers)
+        if headers:
+            response_headers.update(headers)
+
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=response_headers)
+        return Response(
+            content=entry.body, media_type="application/json", headers=response_headers
+        )
+
+    def respond(
+        self,
+        request: Request,
+        key: Hashable,
+        version: int,
+        build: Callable[[], Any],
+        cache_control: str = CATALOG_CACHE_CONTROL,
+        headers: Optional[dict] = None,
+    ) -> Response:
+        """Serve a cached body, or 304 if the client already has it."""
+        entry = self._lookup(key, version) or self._store(key, version, build())
+        return self._to_response(request, entry, cache_control, headers)
+
+    async def respond_async(
+        self,
+        request: Request,
+        key: Hashable,
+        version: int,
+        build: Callable[[], Awaitable[Tuple[Any, Optional[dict]]]],
+        cache_control: str = CATALOG_CACHE_CONTROL,
+    ) -> Response:
+        """Like respond, for bodies that must be loaded asynchronously.
+
+        build returns the payload and any extra headers to cache with it.
+        """
+        entry = self._lookup(key, version)
+        if entry is None:
+            payload, headers = await build()
+            entry = self._store(key, version, payload, headers)
+        return self._to_response(request, entry, cache_control)
+
+    def clear(self) -> None:
+        """Drop all cached bodies."""
+        self._entries.clear()
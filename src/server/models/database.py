@@ -47,10 +47,19 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
 
 async def init_db() -> None:
     """Initialize the database tables."""
+    from .product import PRODUCT_CATALOG_DDL
+
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in PRODUCT_CATALOG_DDL:
+            await conn.exec_driver_sql(statement)
 
 
 def init_db_sync() -> None:
     """Initialize the database tables synchronously."""
+    from .product import PRODUCT_CATALOG_DDL
+
     Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as conn:
+        for statement in PRODUCT_CATALOG_DDL:
+            conn.exec_driver_sql(statement)
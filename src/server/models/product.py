@@ -5,6 +5,8 @@ from typing import Optional
 from sqlalchemy import String, Numeric, Integer, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
+from src.catalog import CHANGE_LOG_SIZE
+
 from .database import Base
 
 
@@ -16,11 +18,11 @@ class Product(Base):
     id: Mapped[str] = mapped_column(String(50), primary_key=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
+    price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False, index=True)
     currency: Mapped[str] = mapped_column(String(3), default="USD")
     inventory: Mapped[int] = mapped_column(Integer, default=0)
     image_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
-    category: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    category: Mapped[Optional[str]] = mapped_column(String(100), nullable=True, index=True)
 
     def to_dict(self) -> dict:
         """Convert product to dictionary."""
@@ -35,6 +37,18 @@ class Product(Base):
             "category": self.category,
         }
 
+    def to_catalog_item(self) -> dict:
+        """Convert product to the catalog format served by /products."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": float(self.price),
+            "description": self.description,
+            "category": self.category,
+            "image": self.image_url,
+            "inventory": self.inventory,
+        }
+
     def to_line_item(self, quantity: int = 1) -> dict:
         """Convert product to UCP line item format."""
         return {
@@ -51,3 +65,81 @@ class Product(Base):
                 "currency": self.currency,
             },
         }
+
+
+_PRUNE_CHANGES = (
+    "DELETE FROM product_changes "
+    f"WHERE seq <= (SELECT MAX(seq) FROM product_changes) - {CHANGE_LOG_SIZE};"
+)
+
+# Full-text search over name and description, plus a change log that records
+# every write. Both are maintained by triggers, so checkout's inventory
+# updates are seen by the catalog routes. products has no INTEGER
+# PRIMARY KEY, so the FTS index is rebuilt on startup in case a VACUUM
+# renumbered rowids.
+PRODUCT_CATALOG_DDL = [
+    # Filter and sort indexes. create_all only adds the column indexes when
+    # it creates the table, so databases created before them get them here
+    # (same names, so these are no-ops elsewhere).
+    "CREATE INDEX IF NOT EXISTS ix_products_price ON products (price)",
+    "CREATE INDEX IF NOT EXISTS ix_products_category ON products (category)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, content='products', content_rowid='rowid'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.rowid, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au
+    AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.rowid, old.name, old.description);
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.rowid, new.name, new.description);
+    END""",
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+    # One row per write, numbered by an AUTOINCREMENT sequence that doubles as
+    # the catalog version and never goes backwards. Each trigger prunes the
+    # log to the last CHANGE_LOG_SIZE entries.
+    """CREATE TABLE IF NOT EXISTS product_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id VARCHAR(50) NOT NULL,
+        op VARCHAR(6) NOT NULL
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_changes_ai AFTER INSERT ON products BEGIN
+        INSERT INTO product_changes (product_id, op) VALUES (new.id, 'upsert');
+        {_PRUNE_CHANGES}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_changes_au AFTER UPDATE ON products BEGIN
+        INSERT INTO product_changes (product_id, op)
+        SELECT old.id, 'delete' WHERE old.id != new.id;
+        INSERT INTO product_changes (product_id, op) VALUES (new.id, 'upsert');
+        {_PRUNE_CHANGES}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_changes_ad AFTER DELETE ON products BEGIN
+        INSERT INTO product_changes (product_id, op) VALUES (old.id, 'delete');
+        {_PRUNE_CHANGES}
+    END""",
+    # Indexed vocabulary for typo-tolerant search, and a version that only
+    # changes when searchable text does (not on inventory updates)
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts_vocab USING fts5vocab(products_fts, 'row')",
+    """CREATE TABLE IF NOT EXISTS search_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO search_meta (id, version) VALUES (1, 1)",
+    """CREATE TRIGGER IF NOT EXISTS search_version_ai AFTER INSERT ON products BEGIN
+        UPDATE search_meta SET version = version + 1 WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_version_au
+    AFTER UPDATE OF name, description ON products BEGIN
+        UPDATE search_meta SET version = version + 1 WHERE id = 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_version_ad AFTER DELETE ON products BEGIN
+        UPDATE search_meta SET version = version + 1 WHERE id = 1;
+    END""",
+]
@@ -1,10 +1,37 @@
 """Multi-shop UCP server - runs multiple shops on different ports."""
 
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import StreamingResponse
+from pathlib import Path
+from typing import List, Optional
 import asyncio
+import json
+import os
+
+from src.catalog import (
+    MAX_BATCH_IDS,
+    MAX_PAGE_SIZE,
+    NDJSON_MEDIA_TYPE,
+    BatchSearchRequest,
+    CatalogStore,
+    InvalidCursor,
+    SearchMode,
+    SortOrder,
+    iter_ndjson,
+    paginate,
+    query_fingerprint,
+)
+
+from .http_cache import DISCOVERY_CACHE_CONTROL, ResponseCache
+
+# A directory of <shop_id>.json product lists. When set, each shop loads
+# its catalog from its file and reloads it when the file changes; changes
+# show up in /products/changes.
+SHOP_CATALOG_DIR = os.getenv("SHOP_CATALOG_DIR")
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "10"))
 
 # Shop configurations
 SHOPS = {
@@ -47,49 +74,173 @@ SHOPS = {
 }
 
 
+def _read_products(path: Path) -> list:
+    data = json.loads(path.read_text())
+    return data["products"] if isinstance(data, dict) else data
+
+
+async def watch_catalog(catalog: CatalogStore, path: Path, interval: float = CATALOG_RELOAD_INTERVAL) -> None:
+    """Keep a catalog in sync with a product list file.
+
+    The file is read at start and again whenever its mtime changes. A
+    missing or malformed file leaves the catalog as it was until fixed.
+    """
+    mtime = None
+    while True:
+        try:
+            current = path.stat().st_mtime_ns
+            if current != mtime:
+                # Each version of the file is tried once, so a bad one is
+                # reported once rather than on every poll
+                mtime = current
+                products = await asyncio.to_thread(_read_products, path)
+                upserts, deletes = catalog.sync(products)
+                if upserts or deletes:
+                    print(f"Reloaded {path}: {upserts} upserted, {deletes} deleted")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading catalog {path}: {e}")
+        await asyncio.sleep(interval)
+
+
 def create_shop_app(shop_id: str, config: dict) -> FastAPI:
     """Create a FastAPI app for a shop."""
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        task = None
+        if SHOP_CATALOG_DIR:
+            task = asyncio.create_task(
+                watch_catalog(catalog, Path(SHOP_CATALOG_DIR) / f"{shop_id}.json")
+            )
+        yield
+        if task is not None:
+            task.cancel()
+
     app = FastAPI(
         title=config["name"],
         description=config["description"],
+        lifespan=lifespan,
     )
+    catalog = CatalogStore(config["products"])
+    # The catalog is only changed by watch_catalog, never by the public API
+    app.state.catalog = catalog
+    response_cache = ResponseCache()
     
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Catalog-Version"],
     )
+
+    def _paginate(rows, limit: Optional[int], cursor: Optional[str], *params):
+        try:
+            return paginate(rows, limit, cursor, query_fingerprint(*params))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    @app.get("/.well-known/ucp")
-    async def discovery():
-        return {
-            "ucp": {
-                "version": "2026-01-11",
-                "capabilities": ["dev.ucp.shopping.checkout", "dev.ucp.shopping.order"]
-            },
-            "merchant": {
-                "id": shop_id,
-                "name": config["name"],
-                "description": config["description"]
-            }
+    manifest = {
+        "ucp": {
+            "version": "2026-01-11",
+            "capabilities": ["dev.ucp.shopping.checkout", "dev.ucp.shopping.order"]
+        },
+        "merchant": {
+            "id": shop_id,
+            "name": config["name"],
+            "description": config["description"]
         }
+    }
+    
+    @app.get("/.well-known/ucp")
+    async def discovery(request: Request):
+        return response_cache.respond(
+            request, "discovery", 1, lambda: manifest, cache_control=DISCOVERY_CACHE_CONTROL
+        )
     
     @app.get("/products")
-    async def get_products():
-        return config["products"]
+    async def get_products(
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        sort: Optional[SortOrder] = None,
+        cursor: Optional[str] = None,
+    ):
+        async def build():
+            # Only run on a cache miss, so polls of an unchanged catalog cost a lookup
+            rows = catalog.sort(catalog.filter(), sort)
+            page, next_cursor = _paginate(rows, limit, cursor, sort)
+            return catalog.rows(page), {"X-Next-Cursor": next_cursor} if next_cursor else None
+
+        return await response_cache.respond_async(
+            request, ("products", limit, sort, cursor), catalog.version, build
+        )
     
     @app.get("/products/search")
-    async def search_products(q: str = "", max_price: float = None, category: str = None):
-        results = config["products"]
-        if q:
-            results = [p for p in results if q.lower() in p["name"].lower() or q.lower() in p["description"].lower()]
-        if max_price:
-            results = [p for p in results if p["price"] <= max_price]
-        if category:
-            results = [p for p in results if p["category"] == category]
-        return {"shop": config["name"], "products": results}
+    async def search_products(
+        q: str = "",
+        max_price: float = None,
+        category: str = None,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        sort: Optional[SortOrder] = None,
+        cursor: Optional[str] = None,
+        facets: bool = False,
+        mode: SearchMode = "exact",
+    ):
+        rows = catalog.query(q, max_price, category, sort, mode)
+        page, next_cursor = _paginate(rows, limit, cursor, q, max_price, category, sort, mode)
+        result = {
+            "shop": config["name"],
+            "products": catalog.rows(page),
+            "total": len(rows),
+            "next_cursor": next_cursor,
+        }
+        if facets:
+            result["facets"] = catalog.facets(rows)
+        return result
     
+    @app.post("/products/search/batch")
+    async def search_products_batch(batch: BatchSearchRequest):
+        results = []
+        for query in batch.queries:
+            rows = catalog.query(query.q, query.max_price, query.category, batch.sort, batch.mode)
+            page, next_cursor = _paginate(
+                rows, batch.limit, None,
+                query.q, query.max_price, query.category, batch.sort, batch.mode,
+            )
+            result = {"products": catalog.rows(page), "total": len(rows), "next_cursor": next_cursor}
+            if batch.facets:
+                result["facets"] = catalog.facets(rows)
+            results.append(result)
+        return {"shop": config["name"], "results": results}
+
+    @app.get("/products/batch")
+    async def get_products_batch(ids: str):
+        product_ids = [product_id for product_id in ids.split(",") if product_id]
+        if len(product_ids) > MAX_BATCH_IDS:
+            raise HTTPException(
+                status_code=400, detail=f"At most {MAX_BATCH_IDS} IDs per batch"
+            )
+        products, missing = catalog.get_many(product_ids)
+        return {"shop": config["name"], "products": products, "missing": missing}
+    
+    @app.get("/products/export")
+    async def export_products():
+        # Rows are streamed from the live catalog; the export is aborted if
+        # it changes, so the rows always match X-Catalog-Version
+        version = catalog.version
+        return StreamingResponse(
+            iter_ndjson(catalog.iter_rows(version)),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={"X-Catalog-Version": str(version)},
+        )
+
+    @app.get("/products/changes")
+    async def get_product_changes(since: int = Query(..., ge=0)):
+        return catalog.changes_since(since)
+
+    @app.get("/products/summary")
+    async def get_product_summary(request: Request):
+        return response_cache.respond(request, "summary", catalog.version, catalog.summary)
+
     @app.get("/health")
     async def health():
         return {"status": "healthy", "shop": config["name"]}
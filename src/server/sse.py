@@ -0,0 +1,20 @@
+"""Server-Sent Events responses."""
+
+import json
+from typing import AsyncIterator, Tuple
+
+from fastapi.responses import StreamingResponse
+
+# Keep proxies from caching or buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def encode_sse(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[str]:
+    """Encode (event, data) pairs as Server-Sent Events."""
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events: AsyncIterator[Tuple[str, dict]]) -> StreamingResponse:
+    """Stream (event, data) pairs to the client as they are produced."""
+    return StreamingResponse(encode_sse(events), media_type="text/event-stream", headers=SSE_HEADERS)
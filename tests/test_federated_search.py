@@ -0,0 +1,92 @@
+"""Federated search across the multi-shop apps, served in-process."""
+
+from collections import defaultdict
+
+import asyncio
+
+import httpx
+import pytest
+
+from src.agent.federated_search import FederatedSearch
+from src.agent.registry import ShopRegistry
+from src.agent.replica import FederationReplica
+from src.agent.resilience import CircuitBreaker
+from src.agent.search_cache import SearchCache
+from src.agent.transport import ShopTransport
+from src.catalog import CatalogSummary
+from src.server.multi_shop import SHOPS, create_shop_app
+
+
+@pytest.fixture
+def shop_apps():
+    return {shop_id: create_shop_app(shop_id, config) for shop_id, config in SHOPS.items()}
+
+
+class CountingTransport(httpx.ASGITransport):
+    requests = 0
+
+    async def handle_async_request(self, request):
+        CountingTransport.requests += 1
+        return await super().handle_async_request(request)
+
+
+def federated_search(shop_apps, mode="auto"):
+    """A FederatedSearch over the shop apps, with every shop's summary loaded."""
+    transport = ShopTransport()
+    shops = []
+    for shop_id, app in shop_apps.items():
+        url = f"http://{shop_id}.test"
+        transport._clients[url] = httpx.AsyncClient(transport=CountingTransport(app))
+        shops.append({"id": shop_id, "name": SHOPS[shop_id]["name"], "url": url})
+    registry = ShopRegistry(config_path=None, default_shops=shops, transport=transport)
+    for shop_id, app in shop_apps.items():
+        registry.entries[shop_id].summary = CatalogSummary(app.state.catalog.summary())
+    return FederatedSearch(
+        transport=transport,
+        cache=SearchCache(),
+        replica=FederationReplica(transport=transport),
+        breakers=defaultdict(CircuitBreaker),
+        registry=registry,
+        mode=mode,
+    )
+
+
+async def test_misspelled_query_is_not_pruned_by_a_false_positive(shop_apps):
+    search = federated_search(shop_apps)
+    # As if Green Thumb's Bloom filter matched the typo by chance
+    search.registry.summary("green_thumb").may_match_terms = lambda terms: True
+    result = await search.search_all_shops("tullips")
+    assert [p["id"] for p in result["results"]] == ["gp_003"]
+    assert result["shops_pruned"] == {}
+
+
+async def test_exact_search_prunes_shops_without_the_terms(shop_apps):
+    search = federated_search(shop_apps, mode="exact")
+    result = await search.search_all_shops("tulips")
+    assert [p["id"] for p in result["results"]] == ["gp_003"]
+    assert result["shops_pruned"] == {
+        "Luxury Blooms": "no_matching_terms",
+        "Green Thumb Plants": "no_matching_terms",
+    }
+
+
+async def test_filters_prune_shops_in_any_mode(shop_apps):
+    search = federated_search(shop_apps)
+    result = await search.search_all_shops("", max_price=10)
+    assert set(result["shops_pruned"]) == {"Luxury Blooms", "Green Thumb Plants"}
+    assert {p["shop_name"] for p in result["results"]} == {"Garden Paradise"}
+
+
+async def test_stale_batch_answers_are_refreshed_in_one_request_per_shop(shop_apps):
+    search = federated_search(shop_apps)
+    queries = [{"query": "roses"}, {"query": "tulips"}, {"query": "plant"}]
+    answers = await search.search_many(queries)
+    for entry in search.cache._entries.values():
+        entry.fresh_until = 0
+    CountingTransport.requests = 0
+
+    assert await search.search_many(queries) == answers
+    await asyncio.gather(*search.cache._refreshes)
+    assert CountingTransport.requests == len(shop_apps)
+    assert search.cache.stats()["stale_hits"] == len(queries)
+    assert all(not search.cache.needs_fetch(key) for key in search.cache._entries)